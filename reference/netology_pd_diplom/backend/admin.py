@@ -1,6 +1,9 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
 
+from backend.basket import recalculate_order_totals
+from backend.cache import bump_order_version
+
 from backend.models import User, Shop, Category, Product, ProductInfo, Parameter, ProductParameter, Order, OrderItem, \
     Contact, ConfirmEmailToken
 
@@ -55,12 +58,33 @@ class ProductParameterAdmin(admin.ModelAdmin):
 
 @admin.register(Order)
 class OrderAdmin(admin.ModelAdmin):
-    pass
+    readonly_fields = ('total_sum',) # сумма ведется по позициям заказа
 
 
 @admin.register(OrderItem)
 class OrderItemAdmin(admin.ModelAdmin):
-    pass
+    """
+    Позиции заказов. Изменение позиции пересчитывает сумму заказа и меняет версию заказов
+    покупателя (ETag списка заказов); в API позиции меняются только в корзине, поэтому это
+    делается здесь, а не сигналом на каждую позицию (сигнал отключил бы пакетное удаление
+    позиций корзины).
+    """
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        recalculate_order_totals([obj.order_id])
+        bump_order_version(obj.order.user_id)
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        recalculate_order_totals([obj.order_id])
+        bump_order_version(obj.order.user_id)
+
+    def delete_queryset(self, request, queryset):
+        orders = dict(queryset.values_list('order_id', 'order__user_id'))
+        super().delete_queryset(request, queryset)
+        recalculate_order_totals(orders)
+        for user_id in set(orders.values()):
+            bump_order_version(user_id)
 
 
 @admin.register(Contact)
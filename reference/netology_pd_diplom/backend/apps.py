@@ -5,9 +5,17 @@ class BackendConfig(AppConfig):
     name = 'backend'
 
     def ready(self):
+        from django.db.models.signals import post_migrate
+        from backend.search import create_search_index
+        post_migrate.connect(create_search_index, sender=self) # таблица полнотекстового индекса (см. backend/search.py)
+
+        from backend.checks import check_shared_cache # регистрация проверки общего кеша (manage.py check)
+
         # Импортируем обработчики сигналов здесь, чтобы избежать циклических импортов
         from backend.signals import (
             password_reset_token_created, 
             new_user_registered_signal, 
-            new_order_signal
+            new_order_signal,
+            catalog_changed_signal,
+            catalog_model_saved_signal,
         )
\ No newline at end of file
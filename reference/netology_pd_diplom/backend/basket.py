@@ -0,0 +1,264 @@
+"""
+Пакетное добавление позиций в корзину.
+
+Все позиции запроса проверяются одним запросом к БД: позиции каталога с остатком,
+статусом магазина и количеством, которое уже лежит в корзине. Остаток проверяется
+в памяти с учетом корзины и повторов позиции в запросе. Если хотя бы одна строка
+не прошла проверку, ничего не записывается, а ответ содержит ошибки по всем строкам.
+Иначе все строки записываются одним INSERT ... ON CONFLICT (unique_order_item) DO UPDATE:
+новые позиции создаются, а количество уже лежащих в корзине увеличивается.
+
+Изменение количества позиций корзины (update_basket_items) выполняется за постоянное
+число запросов: одна проверка, один UPDATE ... SET quantity = CASE id WHEN ... и один DELETE
+для позиций с нулевым количеством - в одной транзакции. Результат возвращается по каждой строке.
+
+Сумма корзины (Order.total_sum) хранится в заказе и меняется на разницу, которую дают
+измененные позиции (UPDATE ... SET total_sum = total_sum + <разница>), - списки заказов
+выводят ее без агрегации позиций. Цена позиции (OrderItem.price) запоминается при добавлении.
+"""
+from typing import Iterable
+
+from django.db import transaction
+from django.db.models import Case, F, OuterRef, PositiveIntegerField, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce
+
+from backend.models import Order, OrderItem, ProductInfo
+
+
+def _line_error(index: int, line, error: str) -> dict:
+    product_info = line.get('product_info') if isinstance(line, dict) else None
+    return {'line': index, 'product_info': product_info, 'error': error}
+
+
+def _to_int(value):
+    # целое число или строка с ним, как принимал OrderItemSerializer; bool и дробные числа - ошибка формата
+    if isinstance(value, bool):
+        return None
+    try:
+        number = int(value)
+    except (TypeError, ValueError):
+        return None
+    return number if isinstance(value, str) or number == value else None
+
+
+def change_order_total(order_id: int, delta: int) -> None:
+    """
+    Изменяет сумму заказа на delta одним UPDATE (без чтения заказа).
+    """
+    if delta:
+        Order.objects.filter(id=order_id).update(total_sum=F('total_sum') + delta)
+
+
+def recalculate_order_totals(order_ids: Iterable[int]) -> None:
+    """
+    Пересчитывает суммы заказов по их позициям одним UPDATE с подзапросом.
+    Нужен, когда позиции меняются не через функции этого модуля (админка, оформление заказа).
+    """
+    line_sums = OrderItem.objects.filter(order_id=OuterRef('pk')).values('order_id').annotate(
+        total=Sum(F('quantity') * F('price'))).values('total')
+    Order.objects.filter(id__in=list(order_ids)).update(
+        total_sum=Coalesce(Subquery(line_sums[:1]), Value(0), output_field=PositiveIntegerField()))
+
+
+def parse_added_lines(lines: list) -> tuple:
+    """
+    Разбор строк добавления в корзину; значения строк приводятся к int.
+
+    Returns:
+        tuple: id позиции -> запрошенное количество (повторы позиции в запросе суммируются)
+            и ошибки формата по строкам
+    """
+    errors = []
+    requested = {}
+    for index, line in enumerate(lines):
+        if not isinstance(line, dict):
+            errors.append(_line_error(index, line, 'Строка должна быть объектом с полями product_info и quantity'))
+            continue
+        product_info_id, quantity = _to_int(line.get('product_info')), _to_int(line.get('quantity'))
+        if product_info_id is None or quantity is None or quantity < 1:
+            errors.append(_line_error(index, line, 'product_info и quantity должны быть целыми числами, quantity > 0'))
+            continue
+        line['product_info'], line['quantity'] = product_info_id, quantity
+        requested[product_info_id] = requested.get(product_info_id, 0) + quantity
+    return requested, errors
+
+
+def check_added_lines(lines: list, requested: dict, stock: dict) -> list:
+    """
+    Проверка строк добавления по остаткам.
+
+    Args:
+        lines: строки запроса (уже прошедшие parse_added_lines)
+        requested (dict): результат parse_added_lines
+        stock (dict): id позиции -> (остаток, статус магазина, количество в корзине или None)
+
+    Returns:
+        list: ошибки по строкам
+    """
+    errors = []
+    for index, line in enumerate(lines):
+        product_info_id = line['product_info']
+        if product_info_id not in stock:
+            errors.append(_line_error(index, line, 'Позиция не найдена'))
+            continue
+        available, shop_state, in_basket = stock[product_info_id]
+        if not shop_state:
+            errors.append(_line_error(index, line, 'Магазин не принимает заказы'))
+        elif (in_basket or 0) + requested[product_info_id] > available:
+            errors.append(_line_error(index, line, f'Недостаточно товара: доступно {available}, '
+                                                   f'в корзине {in_basket or 0}'))
+    return errors
+
+
+def add_basket_items(basket: Order, lines: Iterable) -> tuple:
+    """
+    Добавляет позиции в корзину.
+
+    Args:
+        basket (Order): корзина пользователя
+        lines: строки запроса вида {'product_info': <id позиции>, 'quantity': <количество>}
+
+    Returns:
+        tuple: количество созданных позиций, количество позиций, в которых увеличено количество,
+            и список ошибок по строкам (если он не пуст, корзина не изменена)
+    """
+    lines = list(lines)
+    requested, errors = parse_added_lines(lines)
+    if errors:
+        return 0, 0, errors
+
+    with transaction.atomic():
+        # блокируем корзину: одновременные добавления в одну корзину выполняются по очереди
+        Order.objects.select_for_update().get(id=basket.id)
+        # один запрос: остаток, цена, статус магазина, количество и цена позиции, которая уже есть в корзине
+        # (подзапросы по индексу unique_order_item)
+        basket_item = OrderItem.objects.filter(order_id=basket.id, product_info_id=OuterRef('pk'))
+        stock = {row[0]: row[1:] for row in ProductInfo.objects.filter(id__in=requested).annotate(
+            in_basket=Subquery(basket_item.values('quantity')[:1]),
+            basket_price=Subquery(basket_item.values('price')[:1]),
+        ).values_list('id', 'quantity', 'price', 'shop__state', 'in_basket', 'basket_price')}
+
+        errors = check_added_lines(lines, requested, {product_info_id: (available, shop_state, in_basket)
+                                                      for product_info_id, (available, _, shop_state, in_basket, _)
+                                                      in stock.items()})
+        if errors:
+            return 0, 0, errors
+
+        # позиция, которая уже есть в корзине, получает текущую цену для всего количества
+        new_items = [OrderItem(order_id=basket.id, product_info_id=product_info_id, price=stock[product_info_id][1],
+                               quantity=(stock[product_info_id][3] or 0) + quantity)
+                     for product_info_id, quantity in requested.items()]
+        OrderItem.objects.bulk_create(new_items, update_conflicts=True, unique_fields=['order', 'product_info'],
+                                      update_fields=['quantity', 'price'])
+        change_order_total(basket.id, sum(
+            item.quantity * item.price - (stock[item.product_info_id][3] or 0) * (stock[item.product_info_id][4] or 0)
+            for item in new_items))
+
+    updated = sum(1 for product_info_id in requested if stock[product_info_id][3] is not None)
+    return len(requested) - updated, updated, []
+
+
+def parse_changed_lines(lines: list) -> tuple:
+    """
+    Разбор строк изменения количества; значения строк приводятся к int.
+
+    Returns:
+        tuple: id позиции корзины -> новое количество (при повторах - последнее)
+            и результаты по строкам (None - строка еще не проверена)
+    """
+    results = [None] * len(lines)
+    quantities = {}
+    for index, line in enumerate(lines):
+        if not isinstance(line, dict):
+            line = {}
+        item_id, quantity = _to_int(line.get('id')), _to_int(line.get('quantity'))
+        if item_id is None or quantity is None or quantity < 0:
+            results[index] = {'line': index, 'id': line.get('id'), 'result': 'error',
+                              'error': 'id и quantity должны быть целыми числами, quantity >= 0'}
+            continue
+        line['id'], line['quantity'] = item_id, quantity
+        quantities[item_id] = quantity
+    return quantities, results
+
+
+def check_changed_lines(lines: list, quantities: dict, results: list, stock: dict) -> set:
+    """
+    Проверка строк изменения количества по остаткам; заполняет results.
+
+    Args:
+        stock (dict): id позиции корзины -> остаток товара (только позиции этой корзины)
+
+    Returns:
+        set: id позиций корзины, изменения которых можно применить
+    """
+    for index, line in enumerate(lines):
+        if results[index] is not None:
+            continue
+        item_id, quantity = line['id'], quantities[line['id']]
+        if item_id not in stock:
+            results[index] = {'line': index, 'id': item_id, 'result': 'error', 'error': 'Позиция не найдена в корзине'}
+        elif quantity > stock[item_id]:
+            results[index] = {'line': index, 'id': item_id, 'result': 'error',
+                              'error': f'Недостаточно товара: доступно {stock[item_id]}'}
+        else:
+            results[index] = {'line': index, 'id': item_id, 'result': 'deleted' if quantity == 0 else 'updated'}
+    return {result['id'] for result in results if result['result'] != 'error'}
+
+
+def update_basket_items(basket: Order, lines: Iterable) -> tuple:
+    """
+    Изменяет количество позиций корзины; позиции с количеством 0 удаляются.
+    Строки с ошибками пропускаются, остальные применяются.
+
+    Args:
+        basket (Order): корзина пользователя
+        lines: строки запроса вида {'id': <id позиции корзины>, 'quantity': <новое количество>}
+
+    Returns:
+        tuple: количество измененных позиций, количество удаленных позиций
+            и результаты по строкам: {'line', 'id', 'result': 'updated' | 'deleted' | 'error', 'error'}
+    """
+    lines = list(lines)
+    quantities, results = parse_changed_lines(lines)
+
+    with transaction.atomic():
+        Order.objects.select_for_update().get(id=basket.id) # сумма корзины считается от прочитанных позиций
+        # одна проверка: позиции этой корзины, остаток товара, текущее количество и цена позиции
+        stock, lines_before = {}, {}
+        for item_id, available, quantity, price in OrderItem.objects.filter(
+                order_id=basket.id, id__in=quantities).values_list('id', 'product_info__quantity', 'quantity', 'price'):
+            stock[item_id], lines_before[item_id] = available, (quantity, price)
+        valid = check_changed_lines(lines, quantities, results, stock)
+        changes = {item_id: quantities[item_id] for item_id in valid if quantities[item_id] > 0}
+        removed = [item_id for item_id in valid if quantities[item_id] == 0]
+        updated = deleted = 0
+        if changes: # один UPDATE ... SET quantity = CASE id WHEN <id> THEN <количество> ... END
+            updated = OrderItem.objects.filter(order_id=basket.id, id__in=changes).update(quantity=Case(
+                *[When(id=item_id, then=Value(quantity)) for item_id, quantity in changes.items()],
+                default=F('quantity'), output_field=PositiveIntegerField()))
+        if removed:
+            deleted = OrderItem.objects.filter(order_id=basket.id, id__in=removed).delete()[0]
+        # позиции сохраняют свою цену, сумма корзины меняется на разницу количеств
+        change_order_total(basket.id, sum((quantities[item_id] - lines_before[item_id][0]) * lines_before[item_id][1]
+                                          for item_id in valid))
+    return updated, deleted, results
+
+
+def delete_basket_items(basket: Order, item_ids: Iterable[int]) -> int:
+    """
+    Удаляет позиции корзины и уменьшает сумму корзины на их стоимость.
+
+    Args:
+        basket (Order): корзина пользователя
+        item_ids: id позиций корзины
+
+    Returns:
+        int: количество удаленных позиций
+    """
+    with transaction.atomic():
+        Order.objects.select_for_update().get(id=basket.id)
+        items = OrderItem.objects.filter(order_id=basket.id, id__in=list(item_ids))
+        removed_sum = items.aggregate(total=Sum(F('quantity') * F('price')))['total'] or 0
+        deleted = items.delete()[0]
+        change_order_total(basket.id, -removed_sum)
+    return deleted
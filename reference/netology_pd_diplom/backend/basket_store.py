@@ -0,0 +1,266 @@
+"""
+Корзина в кеше с отложенной записью в БД (включается настройкой BASKET_STORE = 'cache').
+
+Корзина - самая частая запись в API, а до оформления заказа доходит малая часть
+корзин. Поэтому добавление, изменение и удаление позиций меняют только запись
+корзины в кеше (ключ BASKET_KEY): в БД остатки и цены только читаются. В заказ
+(Order/OrderItem) корзина записывается:
+    - при оформлении заказа (checkout);
+    - при просмотре корзины, если в ней есть незаписанные изменения
+      (id позиций корзины, которые принимают PUT и DELETE, - это id OrderItem);
+    - периодической задачей flush_baskets (CELERY_BEAT_SCHEDULE).
+
+Корзины с незаписанными изменениями попадают в журнал: номер записи выдает
+атомарный cache.incr, поэтому журнал работает на любом бекенде кеша. Задача
+читает журнал с последнего записанного номера.
+
+Если запись корзины пропала из кеша (вытеснение, перезапуск Redis), корзина
+читается из БД - в ней последнее записанное состояние; теряются только изменения
+после последней записи. Бекенд кеша должен быть общим для всех процессов (Redis):
+locmem подходит только для тестов.
+"""
+from contextlib import contextmanager
+from time import monotonic, sleep
+from typing import Iterable, Iterator
+from uuid import uuid4
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from backend.basket import check_added_lines, check_changed_lines, parse_added_lines, parse_changed_lines, \
+    recalculate_order_totals
+from backend.cache import LOCK_POLL_INTERVAL, LOCK_TIMEOUT
+from backend.models import Order, OrderItem, ProductInfo
+
+BASKET_TIMEOUT = 60 * 60 * 24 * 7 # время жизни корзины в кеше, секунд (намного больше периода записи в БД)
+PENDING_TIMEOUT = 600 # через сколько секунд корзина, не записанная задачей, снова попадет в журнал
+BASKET_KEY = 'basket:user:{}'
+LOCK_KEY = 'basket:lock:user:{}'
+PENDING_KEY = 'basket:pending:user:{}'
+JOURNAL_SEQ_KEY = 'basket:journal:seq'
+JOURNAL_FLUSHED_KEY = 'basket:journal:flushed'
+JOURNAL_KEY = 'basket:journal:{}'
+
+
+class BasketBusy(Exception):
+    """
+    Корзина заблокирована другим запросом дольше LOCK_TIMEOUT - изменение не выполнено.
+    """
+
+
+def basket_store_enabled() -> bool:
+    """
+    Хранятся ли корзины в кеше (настройка BASKET_STORE).
+    """
+    return getattr(settings, 'BASKET_STORE', 'db') == 'cache'
+
+
+@contextmanager
+def _locked(user_id: int) -> Iterator[None]:
+    # изменения одной корзины выполняются по очереди (cache.add атомарен);
+    # блокировка упавшего процесса истекает через LOCK_TIMEOUT
+    lock = LOCK_KEY.format(user_id)
+    token = uuid4().hex # снимается только своя блокировка, а не взятая другим процессом после истечения нашей
+    deadline = monotonic() + LOCK_TIMEOUT
+    while not cache.add(lock, token, LOCK_TIMEOUT):
+        if monotonic() >= deadline: # без блокировки корзину не меняем
+            raise BasketBusy('Корзина изменяется другим запросом, повторите попытку')
+        sleep(LOCK_POLL_INTERVAL)
+    try:
+        yield
+    finally:
+        if cache.get(lock) == token:
+            cache.delete(lock)
+
+
+def _load(user_id: int) -> dict:
+    # запись корзины: {'lines': {id позиции каталога: [количество, цена, id OrderItem или None]}, 'dirty': bool}
+    basket = cache.get(BASKET_KEY.format(user_id))
+    if basket is None: # корзины нет в кеше - последнее записанное состояние из БД
+        basket = {'dirty': False, 'lines': {
+            product_info_id: [quantity, price, item_id] for product_info_id, quantity, price, item_id in
+            OrderItem.objects.filter(order__user_id=user_id, order__state='basket').values_list(
+                'product_info_id', 'quantity', 'price', 'id')}}
+    return basket
+
+
+def _journal(user_id: int) -> None:
+    # PENDING_KEY хранит номер записи журнала с корзиной; он ставится после самой записи, поэтому
+    # запись, номер которой задача уже прошла, не прочитав ее (выдан, но еще не записан), повторяется
+    pending = cache.get(PENDING_KEY.format(user_id))
+    if pending is not None and pending > cache.get(JOURNAL_FLUSHED_KEY, 0): # корзина в непрочитанной части журнала
+        return
+    try:
+        number = cache.incr(JOURNAL_SEQ_KEY)
+    except ValueError: # счетчика еще нет
+        cache.add(JOURNAL_SEQ_KEY, 0, None)
+        number = cache.incr(JOURNAL_SEQ_KEY)
+    cache.set(JOURNAL_KEY.format(number), user_id, BASKET_TIMEOUT)
+    cache.set(PENDING_KEY.format(user_id), number, PENDING_TIMEOUT)
+
+
+def _save(user_id: int, basket: dict) -> None:
+    basket['dirty'] = True
+    cache.set(BASKET_KEY.format(user_id), basket, BASKET_TIMEOUT)
+    _journal(user_id)
+
+
+def add_items(user_id: int, lines: Iterable) -> tuple:
+    """
+    Добавляет позиции в корзину в кеше. Проверки и ответ - как у add_basket_items.
+
+    Returns:
+        tuple: количество созданных позиций, количество позиций, в которых увеличено количество,
+            и список ошибок по строкам (если он не пуст, корзина не изменена)
+    """
+    lines = list(lines)
+    requested, errors = parse_added_lines(lines)
+    if errors:
+        return 0, 0, errors
+    stock = {row[0]: row[1:] for row in ProductInfo.objects.filter(id__in=requested).values_list(
+        'id', 'quantity', 'price', 'shop__state')}
+    with _locked(user_id):
+        basket = _load(user_id)
+        errors = check_added_lines(lines, requested, {
+            product_info_id: (available, shop_state, basket['lines'].get(product_info_id, [None])[0])
+            for product_info_id, (available, _, shop_state) in stock.items()})
+        if errors:
+            return 0, 0, errors
+        updated = 0
+        for product_info_id, quantity in requested.items():
+            line = basket['lines'].get(product_info_id)
+            if line is None:
+                basket['lines'][product_info_id] = [quantity, stock[product_info_id][1], None]
+            else: # вся позиция получает текущую цену, как при записи в БД
+                line[0], line[1] = line[0] + quantity, stock[product_info_id][1]
+                updated += 1
+        _save(user_id, basket)
+    return len(requested) - updated, updated, []
+
+
+def update_items(user_id: int, lines: Iterable) -> tuple:
+    """
+    Изменяет количество позиций корзины в кеше (по id OrderItem). Проверки и ответ - как у update_basket_items.
+
+    Returns:
+        tuple: количество измененных позиций, количество удаленных позиций и результаты по строкам
+    """
+    lines = list(lines)
+    quantities, results = parse_changed_lines(lines)
+    with _locked(user_id):
+        basket = _load(user_id)
+        product_infos = {line[2]: product_info_id for product_info_id, line in basket['lines'].items()
+                         if line[2] in quantities}
+        available = dict(ProductInfo.objects.filter(id__in=product_infos.values()).values_list('id', 'quantity'))
+        valid = check_changed_lines(lines, quantities, results, {
+            item_id: available.get(product_info_id, 0) for item_id, product_info_id in product_infos.items()})
+        updated = deleted = 0
+        for item_id in valid:
+            if quantities[item_id]:
+                basket['lines'][product_infos[item_id]][0] = quantities[item_id]
+                updated += 1
+            else:
+                del basket['lines'][product_infos[item_id]]
+                deleted += 1
+        if valid:
+            _save(user_id, basket)
+    return updated, deleted, results
+
+
+def delete_items(user_id: int, item_ids: Iterable[int]) -> int:
+    """
+    Удаляет позиции корзины в кеше (по id OrderItem).
+
+    Returns:
+        int: количество удаленных позиций
+    """
+    item_ids = set(item_ids)
+    with _locked(user_id):
+        basket = _load(user_id)
+        removed = [product_info_id for product_info_id, line in basket['lines'].items() if line[2] in item_ids]
+        for product_info_id in removed:
+            del basket['lines'][product_info_id]
+        if removed:
+            _save(user_id, basket)
+    return len(removed)
+
+
+def _write(user_id: int, basket: dict) -> None:
+    # записывает корзину в Order/OrderItem и запоминает id позиций
+    lines = basket['lines']
+    with transaction.atomic():
+        order = Order.objects.filter(user_id=user_id, state='basket').first()
+        if order is None and lines:
+            order = Order.objects.create(user_id=user_id, state='basket')
+        if order is not None:
+            # позиции, снятые с продажи после добавления в корзину, не записываются
+            existing = set(ProductInfo.objects.filter(id__in=lines).values_list('id', flat=True))
+            for product_info_id in set(lines) - existing:
+                del lines[product_info_id]
+            OrderItem.objects.filter(order_id=order.id).exclude(product_info_id__in=list(lines)).delete()
+            OrderItem.objects.bulk_create(
+                [OrderItem(order_id=order.id, product_info_id=product_info_id, quantity=quantity, price=price)
+                 for product_info_id, (quantity, price, _) in lines.items()],
+                update_conflicts=True, unique_fields=['order', 'product_info'], update_fields=['quantity', 'price'])
+            recalculate_order_totals([order.id])
+            for product_info_id, item_id in OrderItem.objects.filter(order_id=order.id).values_list(
+                    'product_info_id', 'id'):
+                lines[product_info_id][2] = item_id
+    basket['dirty'] = False
+    cache.set(BASKET_KEY.format(user_id), basket, BASKET_TIMEOUT)
+
+
+def _flush(user_id: int) -> bool:
+    basket = cache.get(BASKET_KEY.format(user_id))
+    if basket is None or not basket['dirty']:
+        return False
+    _write(user_id, basket)
+    cache.delete(PENDING_KEY.format(user_id)) # корзина записана: следующее изменение снова попадет в журнал
+    return True
+
+
+def flush_basket(user_id: int) -> bool:
+    """
+    Записывает корзину пользователя в БД, если в ней есть незаписанные изменения.
+
+    Returns:
+        bool: была ли корзина записана
+    """
+    with _locked(user_id):
+        return _flush(user_id)
+
+
+def flush_dirty_baskets() -> int:
+    """
+    Записывает в БД корзины из журнала (периодическая задача flush_baskets).
+
+    Returns:
+        int: количество записанных корзин
+    """
+    flushed = cache.get(JOURNAL_FLUSHED_KEY, 0)
+    last = cache.get(JOURNAL_SEQ_KEY, 0)
+    keys = [JOURNAL_KEY.format(number) for number in range(flushed + 1, last + 1)]
+    user_ids = set(cache.get_many(keys).values())
+    count = sum(1 for user_id in user_ids if flush_basket(user_id))
+    cache.set(JOURNAL_FLUSHED_KEY, last, None)
+    cache.delete_many(keys)
+    return count
+
+
+@contextmanager
+def checkout(user_id: int) -> Iterator[None]:
+    """
+    Оформление заказа из корзины в кеше: корзина записывается в БД и на время оформления
+    блокируется; после оформления запись корзины в кеше удаляется (корзина снова читается из БД).
+    Если хранение в кеше выключено, ничего не делает.
+    """
+    if not basket_store_enabled():
+        yield
+        return
+    with _locked(user_id):
+        _flush(user_id)
+        try:
+            yield
+        finally:
+            cache.delete(BASKET_KEY.format(user_id))
@@ -0,0 +1,116 @@
+"""
+Синтетические прайс-листы и замеры производительности импорта.
+
+Генератор пишет прайс формата data/shop1.yaml потоково, поэтому
+прайс на миллион товаров не требует памяти под весь документ.
+Замер повторяет путь PartnerUpdate (потоковый разбор прайса и
+PriceListImporter) и считает запросы к БД и время выполнения.
+"""
+import json
+import resource
+import sys
+from itertools import accumulate
+from random import Random
+from time import perf_counter
+from typing import IO
+
+from django.db import connection
+
+from backend.feed import PriceListReader
+from backend.importer import BATCH_SIZE, PriceListImporter
+from backend.models import Shop
+
+PARAMETER_VALUES = 10 # количество различных значений у одного параметра
+
+
+def _quote(value: str) -> str:
+    """
+    Строка в виде YAML-скаляра в двойных кавычках (экранирование JSON совместимо с YAML).
+    """
+    return json.dumps(value, ensure_ascii=False)
+
+
+def _weights(count: int, skew: float) -> list:
+    """
+    Накопленные веса распределения Ципфа: при skew=0 все варианты равновероятны,
+    с ростом skew товары концентрируются в первых вариантах.
+    """
+    return list(accumulate(1 / rank ** skew for rank in range(1, count + 1)))
+
+
+def write_price_list(stream: IO[str], goods: int, categories: int = 10, parameters: int = 5,
+                     skew: float = 1.0, seed: int = 0, shop: str = 'Синтетический магазин') -> None:
+    """
+    Пишет синтетический прайс-лист в текстовый поток.
+
+    Args:
+        stream: поток для записи (файл, открытый в текстовом режиме)
+        goods (int): количество товаров
+        categories (int): количество категорий
+        parameters (int): количество параметров у каждого товара
+        skew (float): перекос распределения товаров по категориям и значений параметров
+        seed (int): начальное значение генератора случайных чисел (прайс воспроизводим)
+        shop (str): название магазина
+    """
+    random = Random(seed)
+    category_ids = list(range(1, categories + 1))
+    category_weights = _weights(categories, skew)
+    names = [f'Параметр {index}' for index in range(1, parameters * 2 + 1)] # у товаров разные наборы параметров
+    value_weights = _weights(PARAMETER_VALUES, skew)
+
+    stream.write(f'shop: {_quote(shop)}\ncategories:\n')
+    for category_id in category_ids:
+        stream.write(f'  - id: {category_id}\n    name: {_quote(f"Категория {category_id}")}\n')
+    stream.write('\ngoods:\n' if goods else '\ngoods: []\n')
+    for index in range(1, goods + 1):
+        price = random.randint(100, 200000)
+        stream.write(
+            f'  - id: {index}\n'
+            f'    category: {random.choices(category_ids, cum_weights=category_weights)[0]}\n'
+            f'    model: {_quote(f"synthetic/model-{index % 1000}")}\n'
+            f'    name: {_quote(f"Товар {index}")}\n'
+            f'    price: {price}\n'
+            f'    price_rrc: {price + price // 10}\n'
+            f'    quantity: {random.randint(0, 100)}\n')
+        if not parameters:
+            stream.write('    parameters: {}\n')
+            continue
+        stream.write('    parameters:\n')
+        for name in sorted(random.sample(names, parameters)):
+            value = random.choices(range(PARAMETER_VALUES), cum_weights=value_weights)[0]
+            stream.write(f'      {_quote(name)}: {_quote(f"значение {value}")}\n')
+
+
+def peak_rss() -> int:
+    """
+    Пиковый объем резидентной памяти текущего процесса в килобайтах.
+    """
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss // 1024 if sys.platform == 'darwin' else rss # на macOS ru_maxrss в байтах
+
+
+def measure_import(path: str, batch_size: int = BATCH_SIZE) -> dict:
+    """
+    Импортирует прайс из файла так же, как задача PartnerUpdate,
+    и замеряет число запросов к БД и время выполнения.
+
+    Args:
+        path (str): путь к yaml-файлу прайса
+        batch_size (int): количество товаров в одном пакете записи
+
+    Returns:
+        dict: статистика импорта, дополненная полями queries и wall_time
+    """
+    queries = 0
+
+    def count_queries(execute, sql, params, many, context):
+        nonlocal queries
+        queries += 1
+        return execute(sql, params, many, context)
+
+    started = perf_counter()
+    with connection.execute_wrapper(count_queries), open(path, 'rb') as file:
+        reader = PriceListReader(file)
+        shop, _ = Shop.objects.get_or_create(name=reader.shop)
+        stats = PriceListImporter(shop, batch_size).run(reader.categories, reader.goods())
+    return {**stats.as_dict(), 'queries': queries, 'wall_time': round(perf_counter() - started, 3)}
@@ -0,0 +1,172 @@
+"""
+Кеш ответов эндпоинтов каталога (categories, shops, products).
+
+Ключ ответа включает версию каталога, поэтому кеш не нужно чистить:
+после изменения каталога версия увеличивается, и следующие запросы
+читают новые ключи, а старые записи истекают по CACHE_TIMEOUT.
+Версий две: общая (меняется при любом изменении каталога) и версия
+каталога магазина (меняется только при изменении этого магазина).
+Список товаров одного магазина (products?shop_id=...) зависит только
+от версии этого магазина, поэтому импорт прайса одного магазина
+не сбрасывает закешированные страницы других магазинов.
+
+Версии увеличиваются обработчиком сигнала catalog_changed (см. backend/signals.py).
+
+Те же версии (и версия заказов пользователя) дают слабые ETag ответов:
+catalog_etag и order_etag используются с декоратором condition, который
+отвечает 304 Not Modified на совпавший If-None-Match до обращения к БД.
+"""
+from hashlib import md5
+from time import monotonic, sleep, time_ns
+from typing import Any, Callable, Optional
+
+from django.core.cache import cache
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import condition
+from rest_framework.request import Request
+from rest_framework.response import Response
+
+CACHE_TIMEOUT = 300 # время жизни закешированного ответа, секунд
+LOCK_TIMEOUT = 10 # время жизни блокировки на вычисление ответа, секунд
+LOCK_POLL_INTERVAL = 0.05 # период проверки готовности ответа, который вычисляет другой запрос, секунд
+CATALOG_VERSION_KEY = 'catalog:version'
+SHOP_VERSION_KEY = 'catalog:version:shop:{}'
+ORDER_VERSION_KEY = 'orders:version:user:{}'
+
+
+def _initial_version() -> int:
+    # начальная версия - время в микросекундах: если ключ версии вытеснен из кеша,
+    # новая версия не совпадет со старыми, и клиент не получит 304 на устаревший ETag
+    return time_ns() // 1000
+
+
+def _increment(key: str) -> None:
+    try:
+        cache.incr(key)
+    except ValueError: # ключа нет (еще не читался или истек)
+        cache.add(key, _initial_version(), None)
+
+
+def _version(key: str) -> int:
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, _initial_version(), None) # add: если другой запрос успел создать ключ, берем его значение
+        version = cache.get(key, 0)
+    return version
+
+
+def bump_catalog_version(shop_id: Optional[int] = None) -> None:
+    """
+    Увеличивает общую версию каталога и, если указан магазин, версию его каталога.
+
+    Args:
+        shop_id (int): id изменившегося магазина
+    """
+    _increment(CATALOG_VERSION_KEY)
+    if shop_id is not None:
+        _increment(SHOP_VERSION_KEY.format(shop_id))
+
+
+def catalog_version(shop_id: Optional[str] = None) -> int:
+    """
+    Версия, от которой зависит ответ: версия каталога магазина, если ответ
+    ограничен одним магазином, иначе общая версия каталога.
+    """
+    return _version(SHOP_VERSION_KEY.format(shop_id) if shop_id else CATALOG_VERSION_KEY)
+
+
+def bump_order_version(user_id: int) -> None:
+    """
+    Увеличивает версию заказов пользователя (заказ, его позиции или контакт изменились).
+    """
+    _increment(ORDER_VERSION_KEY.format(user_id))
+
+
+def order_version(user_id: int) -> int:
+    """
+    Версия заказов пользователя.
+    """
+    return _version(ORDER_VERSION_KEY.format(user_id))
+
+
+def catalog_etag(request, *args, **kwargs) -> str:
+    """
+    Слабый ETag ответа каталога по той же версии, что и ключ кеша ответа.
+    Функция etag_func для django.views.decorators.http.condition.
+    """
+    version = catalog_version(request.GET.get('shop_id'))
+    return f'W/"catalog-{version}"'
+
+
+def order_etag(request, *args, **kwargs) -> Optional[str]:
+    """
+    Слабый ETag списка заказов пользователя. Заказы содержат позиции каталога
+    (цены, остатки), поэтому ETag зависит и от общей версии каталога.
+    Для неаутентифицированного пользователя ETag не вычисляется.
+    """
+    if not request.user.is_authenticated:
+        return None
+    return f'W/"order-{request.user.id}-{order_version(request.user.id)}-{catalog_version()}"'
+
+
+def response_key(request: Request, version: int) -> str:
+    """
+    Ключ ответа: адрес запроса с параметрами в постоянном порядке и версия каталога.
+    """
+    params = sorted((key, value) for key, values in request.query_params.lists() for value in values)
+    raw = f'{request.get_host()}{request.path}?{params}:{version}'
+    return f'response:{md5(raw.encode()).hexdigest()}'
+
+
+def cached_data(key: str, build: Callable[[], Any]) -> Any:
+    """
+    Возвращает данные из кеша, а при промахе вычисляет их функцией build.
+
+    Защита от лавины запросов: при промахе данные вычисляет только запрос,
+    захвативший блокировку (cache.add атомарен), остальные ждут появления
+    данных в кеше не дольше LOCK_TIMEOUT, после чего вычисляют их сами.
+    """
+    data = cache.get(key)
+    if data is not None:
+        return data
+    lock = f'{key}:lock'
+    deadline = monotonic() + LOCK_TIMEOUT
+    while not cache.add(lock, 1, LOCK_TIMEOUT):
+        if monotonic() > deadline:
+            break
+        sleep(LOCK_POLL_INTERVAL)
+        data = cache.get(key)
+        if data is not None:
+            return data
+    try:
+        data = build()
+        cache.set(key, data, CACHE_TIMEOUT)
+    finally:
+        cache.delete(lock)
+    return data
+
+
+def cached_response(request: Request, build: Callable[[], Response], shop_id: Optional[str] = None) -> Response:
+    """
+    Ответ эндпоинта каталога из кеша. Кешируются данные ответа (response.data),
+    а не отрисованный ответ, поэтому выбор рендерера (JSON или Browsable API) работает как обычно.
+
+    Args:
+        request (Request): запрос
+        build (callable): формирует ответ при промахе кеша
+        shop_id (str): id магазина, если ответ ограничен каталогом одного магазина
+    """
+    data = cached_data(response_key(request, catalog_version(shop_id)), lambda: build().data)
+    return Response(data)
+
+
+class CachedCatalogMixin:
+    """
+    Кеширование списка ListAPIView и ETag по общей версии каталога.
+    """
+    @method_decorator(condition(etag_func=catalog_etag))
+    def get(self, request, *args, **kwargs):
+        return super().get(request, *args, **kwargs)
+
+    def list(self, request, *args, **kwargs):
+        return cached_response(request, lambda: super(CachedCatalogMixin, self).list(request, *args, **kwargs))
@@ -0,0 +1,111 @@
+"""
+Модель каталога для чтения (CatalogEntry).
+
+Импорт прайса записывает плоские записи каталога из уже разобранных товаров
+в той же транзакции, что и ProductInfo, поэтому записи никогда не расходятся
+с каталогом магазина. Записи удаленных позиций удаляет каскад внешнего ключа.
+Каталог, загруженный до появления CatalogEntry (или измененный в обход импорта),
+переносится командой manage.py rebuild_catalog.
+"""
+from distutils.util import strtobool
+from itertools import islice
+from typing import Iterable, Optional
+
+from django.db.models import Prefetch, Q
+
+from backend.models import CatalogEntry, ProductInfo, ProductParameter
+
+CATALOG_CHUNK_SIZE = 1000 # количество записей в одном пакете перестроения
+# поля, которые перезаписываются, если запись позиции уже есть
+CATALOG_FIELDS = ('shop', 'shop_name', 'category', 'category_name', 'product_name', 'model', 'quantity', 'price',
+                  'price_rrc', 'discount', 'parameters')
+# сортировки каталога (параметр ordering) -> порядок записей; id позиции - для однозначного порядка при равных ценах
+CATALOG_ORDERINGS = {
+    'id': ('pk',),
+    'price': ('price', 'pk'),
+    '-price': ('-price', '-pk'),
+    'discount': ('discount', 'pk'),
+    '-discount': ('-discount', '-pk'),
+}
+
+
+def render_parameters(parameters: Iterable) -> list:
+    """
+    Параметры позиции в том виде, в котором их отдает каталог.
+
+    Args:
+        parameters: пары (название, значение)
+    """
+    return [{'parameter': name, 'value': str(value)} for name, value in parameters]
+
+
+def save_catalog_entries(entries: list) -> None:
+    """
+    Создает записи каталога или перезаписывает существующие (INSERT ... ON CONFLICT DO UPDATE).
+    """
+    for entry in entries:
+        entry.discount = entry.price_rrc - entry.price
+    CatalogEntry.objects.bulk_create(entries, update_conflicts=True, unique_fields=['product_info'],
+                                     update_fields=CATALOG_FIELDS)
+
+
+def catalog_filter_query(params) -> Q:
+    """
+    Условие на записи каталога по параметрам запроса price_min, price_max и in_stock.
+
+    Args:
+        params: параметры запроса (QueryDict)
+
+    Raises:
+        ValueError: если цена не целое неотрицательное число или in_stock не логическое значение
+    """
+    query = Q()
+    for name, lookup in (('price_min', 'price__gte'), ('price_max', 'price__lte')):
+        value = params.get(name)
+        if value:
+            if not value.isdigit():
+                raise ValueError(f'{name} должен быть целым неотрицательным числом, получено "{value}"')
+            query &= Q(**{lookup: int(value)})
+    in_stock = params.get('in_stock')
+    if in_stock:
+        query &= Q(quantity__gt=0) if strtobool(in_stock) else Q(quantity=0) # strtobool: ValueError для "abc"
+    return query
+
+
+def catalog_ordering(value: Optional[str]) -> tuple:
+    """
+    Порядок записей каталога по параметру запроса ordering (по умолчанию - по id позиции).
+
+    Raises:
+        ValueError: если сортировка неизвестна
+    """
+    if not value:
+        return CATALOG_ORDERINGS['id']
+    if value not in CATALOG_ORDERINGS:
+        raise ValueError(f'Неизвестная сортировка "{value}". Допустимые: {", ".join(CATALOG_ORDERINGS)}')
+    return CATALOG_ORDERINGS[value]
+
+
+def rebuild_catalog() -> int:
+    """
+    Перестраивает записи каталога по ProductInfo.
+
+    Returns:
+        int: количество записей
+    """
+    CatalogEntry.objects.all().delete()
+    product_infos = ProductInfo.objects.select_related('shop', 'product__category').prefetch_related(
+        Prefetch('product_parameters', queryset=ProductParameter.objects.select_related('parameter').order_by('id')))
+    count = 0
+    iterator = product_infos.order_by('id').iterator(chunk_size=CATALOG_CHUNK_SIZE)
+    while chunk := list(islice(iterator, CATALOG_CHUNK_SIZE)):
+        save_catalog_entries([CatalogEntry(
+            product_info_id=product_info.id, shop_id=product_info.shop_id, shop_name=product_info.shop.name,
+            category_id=product_info.product.category_id, category_name=product_info.product.category.name,
+            product_name=product_info.product.name, model=product_info.model, quantity=product_info.quantity,
+            price=product_info.price, price_rrc=product_info.price_rrc,
+            parameters=render_parameters((parameter.parameter.name, parameter.value)
+                                         for parameter in product_info.product_parameters.all()),
+        ) for product_info in chunk])
+        count += len(chunk)
+    return count
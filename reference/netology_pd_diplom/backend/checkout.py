@@ -0,0 +1,86 @@
+"""
+Оформление заказа из корзины с резервированием остатков.
+
+Резервирование выполняется в одной транзакции:
+    1. корзина переводится в статус "new" условным UPDATE ... WHERE state = 'basket'
+       (повторное оформление той же корзины, например двойной клик, ничего не меняет);
+    2. остаток каждой позиции уменьшается условным UPDATE ... SET quantity = quantity - n
+       WHERE quantity >= n (позиции закрытых магазинов не списываются). Проверка и списание -
+       одна операция в БД, поэтому два покупателя не могут купить одну последнюю единицу;
+    3. если хотя бы одна позиция не списалась, транзакция откатывается целиком
+       и возвращается отчет по всем таким позициям;
+    4. цены позиций фиксируются по текущему прайсу (OrderItem.price), и по ним
+       пересчитывается сумма заказа - дальнейшие изменения прайса ее не меняют.
+Позиции списываются в порядке id ProductInfo: блокировки строк всегда берутся в одном
+порядке, поэтому одновременные заказы с общими позициями не взаимоблокируются.
+Блокируются только строки списываемых позиций - без блокировок таблиц и общих мьютексов.
+"""
+from django.db import transaction
+from django.db.models import F, OuterRef, Subquery
+
+from backend.basket import recalculate_order_totals
+from backend.cache import bump_order_version
+from backend.models import CatalogEntry, Order, OrderItem, ProductInfo
+from backend.signals import catalog_changed
+
+
+def place_order(order: Order, contact_id) -> list:
+    """
+    Оформляет заказ из корзины и резервирует остатки его позиций.
+
+    Args:
+        order (Order): корзина пользователя
+        contact_id: id контакта для доставки
+
+    Returns:
+        list: позиции, которые не удалось зарезервировать (пустой - заказ оформлен):
+            {'id', 'product_info', 'quantity', 'available', 'error'}
+
+    Raises:
+        Order.DoesNotExist: если заказ уже оформлен (не в статусе корзины)
+    """
+    with transaction.atomic():
+        if not Order.objects.filter(id=order.id, state='basket').update(state='new', contact_id=contact_id):
+            raise Order.DoesNotExist
+        items = list(OrderItem.objects.filter(order_id=order.id).order_by('product_info_id').values_list(
+            'id', 'product_info_id', 'quantity', 'product_info__shop_id', 'product_info__shop__state'))
+
+        failed = [] # (позиция, ошибка)
+        for item in items:
+            item_id, product_info_id, quantity, _, shop_state = item
+            if not shop_state:
+                failed.append((item, 'Магазин не принимает заказы'))
+                continue
+            # условие только на саму строку ProductInfo (без JOIN): при одновременном списании
+            # PostgreSQL перепроверяет его по новой версии строки после снятия блокировки
+            if not ProductInfo.objects.filter(id=product_info_id, quantity__gte=quantity).update(
+                    quantity=F('quantity') - quantity):
+                failed.append((item, 'Недостаточно товара'))
+
+        if failed:
+            available = dict(ProductInfo.objects.filter(id__in=[item[1] for item, _ in failed]).values_list(
+                'id', 'quantity'))
+            transaction.set_rollback(True) # откатываем смену статуса и уже списанные остатки
+            return [{'id': item_id, 'product_info': product_info_id, 'quantity': quantity,
+                     'available': available[product_info_id], 'error': error}
+                    for (item_id, product_info_id, quantity, _, _), error in failed]
+
+        # цены позиций на момент оформления (строки ProductInfo уже заблокированы списанием) и сумма заказа по ним
+        OrderItem.objects.filter(order_id=order.id).update(price=Subquery(
+            ProductInfo.objects.filter(id=OuterRef('product_info_id')).values('price')[:1]))
+        recalculate_order_totals([order.id])
+        # остатки в модели каталога для чтения - одним UPDATE из ProductInfo в той же транзакции
+        CatalogEntry.objects.filter(product_info_id__in=[item[1] for item in items]).update(quantity=Subquery(
+            ProductInfo.objects.filter(id=OuterRef('product_info_id')).values('quantity')[:1]))
+        shop_ids = {item[3] for item in items}
+        user_id = order.user_id
+
+        def committed():
+            bump_order_version(user_id)
+            for shop_id in shop_ids: # остатки в каталоге магазинов изменились
+                catalog_changed.send(sender=place_order, shop_id=shop_id)
+
+        transaction.on_commit(committed)
+
+    order.state, order.contact_id = 'new', contact_id
+    return []
@@ -0,0 +1,28 @@
+"""
+Проверки настроек проекта (manage.py check, запуск runserver).
+"""
+from django.conf import settings
+from django.core.checks import Error, Tags, register
+
+# бекенды кеша, данные которых видны только своему процессу
+PROCESS_LOCAL_CACHES = ('django.core.cache.backends.locmem.LocMemCache', 'django.core.cache.backends.dummy.DummyCache')
+
+
+@register(Tags.caches)
+def check_shared_cache(app_configs, **kwargs) -> list:
+    """
+    Кеш должен быть общим для веб-процесса и воркеров Celery: импорт в воркере увеличивает
+    версии каталога (см. backend/cache.py), по которым веб-процесс отдает закешированные ответы и ETag.
+    С кешем в памяти процесса веб-процесс не видит этих изменений и бессрочно отдает устаревший каталог.
+    """
+    if getattr(settings, 'TESTING', False):
+        return []
+    backend = settings.CACHES['default']['BACKEND']
+    if backend in PROCESS_LOCAL_CACHES:
+        return [Error(
+            f'Кеш {backend} не общий для процессов: версии каталога, которые меняет воркер Celery, '
+            f'не дойдут до веб-процесса',
+            hint='Используйте общий кеш, например RedisCache (CACHE_REDIS_URL)',
+            id='backend.E001',
+        )]
+    return []
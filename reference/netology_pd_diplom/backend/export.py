@@ -0,0 +1,101 @@
+"""
+Потоковая выгрузка каталога магазина.
+
+Каталог читается из БД пакетами по EXPORT_CHUNK_SIZE позиций
+(iterator(chunk_size=...) с prefetch параметров) и сразу отдается клиенту,
+поэтому расход памяти не зависит от размера каталога.
+Формат yaml совпадает с форматом прайса, который принимает PartnerUpdate
+(см. data/shop1.yaml): выгрузку можно загрузить обратно без изменений.
+В форматах csv и ndjson выгружаются только товары.
+"""
+import csv
+from typing import Iterator
+
+import yaml
+from django.db.models import Prefetch
+from ujson import dumps as dump_json
+
+from backend.importer import chunked
+from backend.models import Shop, ProductInfo, ProductParameter
+
+try:
+    from yaml import CSafeDumper as ExportDumper # сериализатор на libyaml (C), если PyYAML собран с ним
+except ImportError:
+    from yaml import SafeDumper as ExportDumper
+
+EXPORT_CHUNK_SIZE = 2000 # количество позиций, читаемых из БД за один запрос
+CSV_FIELDS = ('id', 'category', 'model', 'name', 'price', 'price_rrc', 'quantity', 'parameters')
+
+
+def export_goods(shop: Shop, chunk_size: int = EXPORT_CHUNK_SIZE) -> Iterator[dict]:
+    """
+    Отдает позиции магазина по одной в формате товара прайс-листа.
+
+    Yields:
+        dict: товар (id - внешний id позиции, category - id категории, parameters - словарь)
+    """
+    product_infos = ProductInfo.objects.filter(shop_id=shop.id).select_related('product').prefetch_related(
+        Prefetch('product_parameters', queryset=ProductParameter.objects.select_related('parameter'))).order_by('id')
+    for product_info in product_infos.iterator(chunk_size=chunk_size):
+        yield {
+            'id': product_info.external_id,
+            'category': product_info.product.category_id,
+            'model': product_info.model,
+            'name': product_info.product.name,
+            'price': product_info.price,
+            'price_rrc': product_info.price_rrc,
+            'quantity': product_info.quantity,
+            'parameters': {parameter.parameter.name: parameter.value
+                           for parameter in product_info.product_parameters.all()},
+        }
+
+
+def _dump_yaml(data) -> str:
+    return yaml.dump(data, Dumper=ExportDumper, allow_unicode=True, sort_keys=False, default_flow_style=False)
+
+
+def export_yaml(shop: Shop) -> Iterator[str]:
+    """
+    Выгрузка в формате прайс-листа: shop, categories, goods.
+    """
+    categories = [{'id': category_id, 'name': name}
+                  for category_id, name in shop.categories.order_by('id').values_list('id', 'name')]
+    yield _dump_yaml({'shop': shop.name, 'categories': categories})
+    yield 'goods:\n'
+    for chunk in chunked(export_goods(shop), EXPORT_CHUNK_SIZE):
+        yield _dump_yaml(chunk)
+
+
+class _Echo:
+    """
+    Псевдо-файл для csv.writer: возвращает записанную строку вместо записи в буфер.
+    """
+    def write(self, value: str) -> str:
+        return value
+
+
+def export_csv(shop: Shop) -> Iterator[str]:
+    """
+    Выгрузка товаров в csv, параметры записываются в одну колонку объектом JSON.
+    """
+    writer = csv.writer(_Echo())
+    yield writer.writerow(CSV_FIELDS)
+    for item in export_goods(shop):
+        item['parameters'] = dump_json(item['parameters'], ensure_ascii=False)
+        yield writer.writerow([item[field] for field in CSV_FIELDS])
+
+
+def export_ndjson(shop: Shop) -> Iterator[str]:
+    """
+    Выгрузка товаров в ndjson: по одному объекту JSON на строку.
+    """
+    for item in export_goods(shop):
+        yield dump_json(item, ensure_ascii=False) + '\n'
+
+
+# формат -> (генератор выгрузки, content type, расширение файла)
+EXPORT_FORMATS = {
+    'yaml': (export_yaml, 'application/x-yaml; charset=utf-8', 'yaml'),
+    'csv': (export_csv, 'text/csv; charset=utf-8', 'csv'),
+    'ndjson': (export_ndjson, 'application/x-ndjson; charset=utf-8', 'ndjson'),
+}
@@ -0,0 +1,108 @@
+"""
+Фасетный фильтр каталога по параметрам товаров.
+
+Фильтр передается в products параметром parameter=<название>:<значение>
+(можно несколько раз): значения одного параметра объединяются через ИЛИ,
+разные параметры - через И.
+
+Счетчики значений берутся из таблицы ProductFacet, в которой импорт хранит
+количество позиций каждого магазина в каждой категории по значениям параметров.
+Запрос каталога суммирует несколько строк этой таблицы вместо GROUP BY по
+ProductParameter. Счетчики относятся к каталогу, ограниченному shop_id,
+category_id и фильтрами price_min, price_max и in_stock (без учета фильтров по
+параметрам): они показывают, сколько позиций будет найдено при выборе значения.
+Цена и остаток в таблице фасетов не хранятся, поэтому при фильтре по ним
+счетчики считаются одним GROUP BY по ProductParameter позиций, прошедших фильтр.
+"""
+from typing import Optional
+
+from django.db.models import Count, Exists, OuterRef, Q, Sum
+
+from backend.models import CatalogEntry, ProductFacet, ProductParameter
+
+FACET_VALUES_LIMIT = 50 # сколько самых частых значений параметра отдавать в счетчиках
+
+
+def rebuild_facets(shop_id: int) -> None:
+    """
+    Пересчитывает фасеты магазина по его текущему каталогу (один GROUP BY на импорт).
+
+    Args:
+        shop_id (int): id магазина
+    """
+    ProductFacet.objects.filter(shop_id=shop_id).delete()
+    rows = ProductParameter.objects.filter(product_info__shop_id=shop_id).values(
+        'product_info__product__category_id', 'parameter_id', 'value').annotate(count=Count('id')).order_by()
+    ProductFacet.objects.bulk_create(
+        [ProductFacet(shop_id=shop_id, category_id=row['product_info__product__category_id'],
+                      parameter_id=row['parameter_id'], value=row['value'], count=row['count']) for row in rows],
+        batch_size=1000)
+
+
+def parse_parameter_filters(values: list) -> dict:
+    """
+    Разбирает значения параметра запроса parameter.
+
+    Args:
+        values (list): строки вида '<название>:<значение>'
+
+    Returns:
+        dict: {название параметра: [значения]}
+
+    Raises:
+        ValueError: если строка не в формате '<название>:<значение>'
+    """
+    filters = {}
+    for value in values:
+        name, separator, parameter_value = value.partition(':')
+        if not separator or not name:
+            raise ValueError(f'Фильтр по параметру должен иметь вид <название>:<значение>, получено "{value}"')
+        filters.setdefault(name, []).append(parameter_value)
+    return filters
+
+
+def parameter_query(filters: dict) -> Q:
+    """
+    Условие на ProductInfo: у позиции есть каждый параметр фильтра с одним из выбранных значений.
+    """
+    query = Q()
+    for name, values in filters.items():
+        query &= Q(Exists(ProductParameter.objects.filter(
+            product_info_id=OuterRef('pk'), parameter__name=name, value__in=values)))
+    return query
+
+
+def facet_counts(shop_id: Optional[str] = None, category_id: Optional[str] = None,
+                 filters: Optional[Q] = None) -> list:
+    """
+    Счетчики значений параметров для позиций открытых магазинов.
+
+    Args:
+        shop_id (str): ограничить магазином
+        category_id (str): ограничить категорией
+        filters (Q): условие на записи каталога по цене и наличию (см. backend.catalog.catalog_filter_query)
+
+    Returns:
+        list: [{'parameter': название, 'values': [{'value': значение, 'count': количество}, ...]}, ...]
+    """
+    if filters: # цена и остаток есть только в каталоге: считаем по параметрам отфильтрованных позиций
+        entries = CatalogEntry.objects.filter(Q(shop__state=True) & filters)
+        if shop_id:
+            entries = entries.filter(shop_id=shop_id)
+        if category_id:
+            entries = entries.filter(category_id=category_id)
+        rows = ProductParameter.objects.filter(product_info_id__in=entries.values('pk')).values(
+            'parameter__name', 'value').annotate(total=Count('id'))
+    else:
+        facets = ProductFacet.objects.filter(shop__state=True)
+        if shop_id:
+            facets = facets.filter(shop_id=shop_id)
+        if category_id:
+            facets = facets.filter(category_id=category_id)
+        rows = facets.values('parameter__name', 'value').annotate(total=Sum('count'))
+    result = {}
+    for row in rows.order_by('parameter__name', '-total', 'value'):
+        values = result.setdefault(row['parameter__name'], [])
+        if len(values) < FACET_VALUES_LIMIT:
+            values.append({'value': row['value'], 'count': row['total']})
+    return [{'parameter': name, 'values': values} for name, values in result.items()]
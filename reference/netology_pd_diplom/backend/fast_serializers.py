@@ -0,0 +1,217 @@
+"""
+Быстрая сериализация для чтения списков (каталог, корзина, заказы).
+
+Функции строят словари напрямую из строк values() или из объектов с уже
+выполненным prefetch, минуя поля DRF (to_representation, get_attribute и т.д.
+на каждое поле каждого объекта). Результат совпадает с выводом сериализаторов
+из backend/serializers.py байт в байт - это проверяют контрактные тесты
+(tests/test_serializers.py), поэтому при изменении сериализатора нужно менять
+и функцию здесь.
+
+Параметры запроса fields и expand (parse_fieldset) сужают вывод: fields - какие
+поля выводить, expand - какие вложенные данные раскрывать. Запрос к БД строится
+под выбранные поля (catalog_entry_values, prepare_orders), поэтому ненужные
+столбцы, JOIN и prefetch (например, параметры товаров) не выполняются.
+"""
+from typing import Iterable, Optional
+
+from django.db.models import F, Prefetch, Q, QuerySet, Sum
+from rest_framework import serializers
+
+from backend.models import Order, OrderItem, ProductInfo, ProductParameter
+
+# поля вывода CatalogEntrySerializer и столбцы CatalogEntry, из которых они строятся
+CATALOG_ENTRY_COLUMNS = {
+    'id': ('pk',),
+    'model': ('model',),
+    'product': ('product_name', 'category_name'),
+    'shop': ('shop_id',),
+    'quantity': ('quantity',),
+    'price': ('price',),
+    'price_rrc': ('price_rrc',),
+    'product_parameters': ('parameters',),
+}
+CATALOG_ENTRY_FIELDS = tuple(CATALOG_ENTRY_COLUMNS)
+CATALOG_EXPANSIONS = ('facets',) # счетчики фасетов - отдельный запрос
+# поля CatalogEntry для values(), из которых строится полный вывод CatalogEntrySerializer
+CATALOG_ENTRY_VALUES = ('pk', 'model', 'product_name', 'category_name', 'shop_id', 'quantity', 'price', 'price_rrc',
+                        'parameters')
+
+_CATALOG_ENTRY_GETTERS = {
+    'id': lambda row: row['pk'],
+    'model': lambda row: row['model'],
+    'product': lambda row: {'name': row['product_name'], 'category': row['category_name']},
+    'shop': lambda row: row['shop_id'],
+    'quantity': lambda row: row['quantity'],
+    'price': lambda row: row['price'],
+    'price_rrc': lambda row: row['price_rrc'],
+    'product_parameters': lambda row: row['parameters'],
+}
+
+ORDER_FIELDS = ('id', 'ordered_items', 'state', 'dt', 'total_sum', 'contact')
+# product_info - позиции заказа с данными товара (иначе только id позиции каталога),
+# product_parameters - то же с параметрами товара
+ORDER_EXPANSIONS = ('product_info', 'product_parameters')
+
+_datetime = serializers.DateTimeField() # формат даты и часовой пояс - как у OrderSerializer
+
+
+def parse_fieldset(value: Optional[str], allowed: tuple) -> Optional[frozenset]:
+    """
+    Разбирает параметр запроса fields или expand: имена через запятую.
+
+    Args:
+        value (str): значение параметра, None - параметр не указан
+        allowed (tuple): допустимые имена
+
+    Returns:
+        frozenset: выбранные имена или None, если параметр не указан
+
+    Raises:
+        ValueError: если указаны неизвестные имена
+    """
+    if value is None:
+        return None
+    names = frozenset(name.strip() for name in value.split(',') if name.strip())
+    unknown = names - set(allowed)
+    if unknown:
+        raise ValueError(f'Неизвестные поля: {", ".join(sorted(unknown))}. Допустимые: {", ".join(allowed)}')
+    return names
+
+
+def catalog_entry_values(fields: Optional[frozenset] = None) -> tuple:
+    """
+    Столбцы CatalogEntry для values(), нужные для вывода полей fields (None - всех полей).
+    pk выбирается всегда: по нему работает курсорная пагинация.
+    """
+    if fields is None:
+        return CATALOG_ENTRY_VALUES
+    columns = ['pk']
+    for field in CATALOG_ENTRY_FIELDS:
+        if field in fields:
+            columns.extend(column for column in CATALOG_ENTRY_COLUMNS[field] if column not in columns)
+    return tuple(columns)
+
+
+def catalog_entry_data(row: dict) -> dict:
+    """
+    Вывод CatalogEntrySerializer (и ProductInfoSerializer) из строки CatalogEntry.values(*CATALOG_ENTRY_VALUES).
+    """
+    return {
+        'id': row['pk'],
+        'model': row['model'],
+        'product': {'name': row['product_name'], 'category': row['category_name']},
+        'shop': row['shop_id'],
+        'quantity': row['quantity'],
+        'price': row['price'],
+        'price_rrc': row['price_rrc'],
+        'product_parameters': row['parameters'],
+    }
+
+
+def catalog_entries_data(rows: Iterable[dict], fields: Optional[frozenset] = None) -> list:
+    """
+    Вывод списка позиций каталога из строк values(*catalog_entry_values(fields)): только поля fields
+    (в порядке полей сериализатора), None - все поля.
+    """
+    if fields is None:
+        return [catalog_entry_data(row) for row in rows]
+    getters = [(field, getter) for field, getter in _CATALOG_ENTRY_GETTERS.items() if field in fields]
+    return [{field: getter(row) for field, getter in getters} for row in rows]
+
+
+def product_info_data(product_info: ProductInfo, parameters: bool = True) -> dict:
+    """
+    Вывод ProductInfoSerializer. Продукт с категорией и параметры с названиями должны быть загружены заранее.
+    При parameters=False поле product_parameters не выводится (и параметры можно не загружать).
+    """
+    product = product_info.product
+    data = {
+        'id': product_info.id,
+        'model': product_info.model,
+        'product': {'name': product.name, 'category': str(product.category)},
+        'shop': product_info.shop_id,
+        'quantity': product_info.quantity,
+        'price': product_info.price,
+        'price_rrc': product_info.price_rrc,
+    }
+    if parameters:
+        data['product_parameters'] = [{'parameter': str(parameter.parameter), 'value': parameter.value}
+                                      for parameter in product_info.product_parameters.all()]
+    return data
+
+
+def prepare_orders(queryset: QuerySet, fields: Optional[frozenset] = None,
+                   expand: Optional[frozenset] = None, shop_user_id: Optional[int] = None) -> QuerySet:
+    """
+    Добавляет к запросу заказов только те JOIN, prefetch и аннотации, которые нужны
+    для вывода полей fields с раскрытием expand (None - все поля / все раскрытия).
+    Например, fields=id,state,total_sum - это один запрос без позиций и параметров.
+    Если указан shop_user_id (заказы для магазина), total_sum - сумма только позиций магазинов
+    этого пользователя, а не сумма всего заказа.
+    """
+    fields = frozenset(ORDER_FIELDS) if fields is None else fields
+    expand = frozenset(ORDER_EXPANSIONS) if expand is None else expand
+    if 'ordered_items' in fields:
+        if expand: # товар с продуктом и категорией - JOIN в запросе позиций
+            queryset = queryset.prefetch_related(Prefetch(
+                'ordered_items', queryset=OrderItem.objects.select_related('product_info__product__category')))
+        else:
+            queryset = queryset.prefetch_related('ordered_items')
+        if 'product_parameters' in expand:
+            queryset = queryset.prefetch_related(Prefetch(
+                'ordered_items__product_info__product_parameters',
+                queryset=ProductParameter.objects.select_related('parameter')))
+    if 'contact' in fields:
+        queryset = queryset.select_related('contact')
+    if 'total_sum' in fields and shop_user_id is not None:
+        queryset = queryset.annotate(shop_total_sum=Sum(
+            F('ordered_items__quantity') * F('ordered_items__price'),
+            filter=Q(ordered_items__product_info__shop__user_id=shop_user_id)))
+    return queryset # total_sum хранится в заказе: без агрегации всех позиций и DISTINCT
+
+
+def order_data(order: Order, fields: Optional[frozenset] = None, expand: Optional[frozenset] = None) -> dict:
+    """
+    Вывод OrderSerializer для заказа, подготовленного prepare_orders с теми же fields и expand.
+    """
+    data = {}
+    fields = frozenset(ORDER_FIELDS) if fields is None else fields
+    expand = frozenset(ORDER_EXPANSIONS) if expand is None else expand
+    if 'id' in fields:
+        data['id'] = order.id
+    if 'ordered_items' in fields:
+        if expand:
+            parameters = 'product_parameters' in expand
+            data['ordered_items'] = [
+                {'id': item.id, 'product_info': product_info_data(item.product_info, parameters),
+                 'quantity': item.quantity, 'price': item.price} for item in order.ordered_items.all()]
+        else:
+            data['ordered_items'] = [{'id': item.id, 'product_info': item.product_info_id, 'quantity': item.quantity,
+                                      'price': item.price} for item in order.ordered_items.all()]
+    if 'state' in fields:
+        data['state'] = order.state
+    if 'dt' in fields:
+        data['dt'] = _datetime.to_representation(order.dt)
+    if 'total_sum' in fields:
+        data['total_sum'] = getattr(order, 'shop_total_sum', order.total_sum) # для магазина - его часть заказа
+    if 'contact' in fields:
+        contact = order.contact
+        data['contact'] = None if contact is None else {
+            'id': contact.id,
+            'city': contact.city,
+            'street': contact.street,
+            'house': contact.house,
+            'structure': contact.structure,
+            'building': contact.building,
+            'apartment': contact.apartment,
+            'phone': contact.phone,
+        }
+    return data
+
+
+def orders_data(orders, fields: Optional[frozenset] = None, expand: Optional[frozenset] = None) -> list:
+    """
+    Вывод OrderSerializer(orders, many=True) (с fields и expand - только выбранные поля).
+    """
+    return [order_data(order, fields, expand) for order in orders]
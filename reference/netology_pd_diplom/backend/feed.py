@@ -0,0 +1,247 @@
+"""
+Потоковое чтение прайс-листов партнёров.
+
+Прайс не загружается в память целиком: файл скачивается во временный файл
+(в памяти остаются только первые FEED_MEMORY_LIMIT байт), а YAML разбирается
+по событиям парсера. Товары из раздела goods отдаются по одному, поэтому
+расход памяти не зависит от размера прайса.
+
+Неизменившийся прайс не скачивается повторно (условный GET по ETag/Last-Modified),
+а по хешу содержимого его можно не разбирать, даже если сервер не поддерживает 304.
+"""
+from collections import deque
+from dataclasses import dataclass
+from hashlib import sha256
+from tempfile import SpooledTemporaryFile
+from typing import IO, Iterator, Optional
+
+from requests import get
+from yaml import SafeLoader, StreamStartEvent, DocumentStartEvent, MappingStartEvent, MappingEndEvent, \
+    SequenceStartEvent, SequenceEndEvent, CollectionStartEvent, CollectionEndEvent, ScalarEvent
+from yaml.composer import Composer
+from yaml.constructor import SafeConstructor
+from yaml.resolver import Resolver
+
+try:
+    from yaml import CSafeLoader as FeedLoader # парсер на libyaml (C), если PyYAML собран с ним
+except ImportError:
+    FeedLoader = SafeLoader
+
+FEED_MEMORY_LIMIT = 8 * 1024 * 1024 # сколько байт прайса держать в памяти, прежде чем сбросить на диск
+FEED_CHUNK_SIZE = 64 * 1024 # размер блока при скачивании прайса
+# таймауты скачивания прайса, секунд: подключение и ожидание очередного блока (не всего файла),
+# чтобы зависший сервер партнера не занимал воркер бесконечно
+FEED_TIMEOUT = (10, 60)
+
+
+@dataclass
+class PriceListDownload:
+    """
+    Скачанный прайс и сведения для условного запроса следующей версии.
+    """
+    file: IO[bytes] # временный файл с прайсом, установленный на начало
+    etag: str = ''
+    last_modified: str = ''
+    digest: str = '' # SHA-256 содержимого
+
+
+def fetch_price_list(url: str, etag: str = '', last_modified: str = '') -> Optional[PriceListDownload]:
+    """
+    Скачивает прайс по url во временный файл, одновременно вычисляя его хеш.
+
+    Если переданы ETag и Last-Modified прошлой загрузки, запрос отправляется
+    условным (If-None-Match / If-Modified-Since).
+
+    Args:
+        url (str): адрес yaml-файла прайса
+        etag (str): ETag прошлой загрузки
+        last_modified (str): Last-Modified прошлой загрузки
+
+    Returns:
+        PriceListDownload: скачанный прайс или None, если сервер ответил 304 Not Modified;
+            временный файл закрывает вызывающий код
+
+    Raises:
+        requests.RequestException: если прайс не удалось скачать
+    """
+    headers = {}
+    if etag:
+        headers['If-None-Match'] = etag
+    if last_modified:
+        headers['If-Modified-Since'] = last_modified
+    with get(url, headers=headers, stream=True, timeout=FEED_TIMEOUT) as response:
+        if response.status_code == 304:
+            return None
+        response.raise_for_status()
+        feed = SpooledTemporaryFile(max_size=FEED_MEMORY_LIMIT)
+        digest = sha256()
+        try:
+            for block in response.iter_content(FEED_CHUNK_SIZE):
+                feed.write(block)
+                digest.update(block)
+        except BaseException: # обрыв или таймаут на середине файла
+            feed.close()
+            raise
+    feed.seek(0)
+    return PriceListDownload(file=feed, etag=response.headers.get('ETag', ''),
+                             last_modified=response.headers.get('Last-Modified', ''), digest=digest.hexdigest())
+
+
+class _EventComposer(Composer, SafeConstructor, Resolver):
+    """
+    Собирает python-объект из заранее накопленных событий парсера.
+
+    Парсер на C не позволяет собрать часть документа, поэтому события одного
+    товара накапливаются в очереди и собираются штатными Composer и SafeConstructor.
+    """
+
+    def __init__(self):
+        Composer.__init__(self)
+        SafeConstructor.__init__(self)
+        Resolver.__init__(self)
+        self.events = deque()
+
+    def check_event(self, *choices):
+        if not self.events:
+            return False
+        return not choices or isinstance(self.events[0], choices)
+
+    def peek_event(self):
+        return self.events[0]
+
+    def get_event(self):
+        return self.events.popleft()
+
+    def construct(self, events: list):
+        self.events.extend(events)
+        node = self.compose_node(None, None)
+        self.anchors = {}
+        return self.construct_document(node)
+
+
+class PriceListReader:
+    """
+    Потоковый разбор прайс-листа формата data/shop1.yaml.
+
+    Разделы shop и categories читаются сразу при создании объекта,
+    а товары отдаются по одному методом goods(). Если goods идет в файле
+    раньше остальных разделов (например, ключи отсортированы по алфавиту),
+    товары при первом проходе пропускаются, а затем файл читается повторно
+    с начала раздела goods - для этого поток должен поддерживать seek().
+
+    Attributes:
+        header (dict): разделы прайса, кроме goods
+    """
+
+    def __init__(self, stream: IO):
+        self._stream = stream
+        self._composer = _EventComposer()
+        self._goods_pending = False # парсер стоит на начале раздела goods
+        self._goods_skipped = False # раздел goods пропущен при первом проходе
+        self.header = {}
+        self._open()
+        while not self._loader.check_event(MappingEndEvent):
+            key = self._read_value()
+            if key != 'goods':
+                self.header[key] = self._read_value()
+            elif {'shop', 'categories'} <= self.header.keys():
+                self._goods_pending = True
+                break
+            else:
+                self._skip_value()
+                self._goods_skipped = True
+        if 'shop' not in self.header:
+            raise ValueError('В прайсе нет раздела shop')
+
+    @property
+    def shop(self) -> str:
+        return self.header['shop']
+
+    @property
+    def categories(self) -> list:
+        return self.header.get('categories') or []
+
+    def _open(self) -> None:
+        """
+        Создает парсер и читает начало документа до первого ключа верхнего уровня.
+        """
+        self._loader = FeedLoader(self._stream)
+        for event_class in (StreamStartEvent, DocumentStartEvent, MappingStartEvent):
+            event = self._loader.get_event()
+            if not isinstance(event, event_class):
+                raise ValueError(f'Неверная структура прайса: ожидалось {event_class.__name__}, '
+                                 f'получено {type(event).__name__}')
+
+    def _node_events(self) -> Iterator:
+        """
+        Забирает из парсера события одного узла (скаляра или коллекции целиком).
+        """
+        depth = 0
+        while True:
+            event = self._loader.get_event()
+            yield event
+            if isinstance(event, CollectionStartEvent):
+                depth += 1
+            elif isinstance(event, CollectionEndEvent):
+                depth -= 1
+            if depth == 0:
+                return
+
+    def _read_value(self):
+        return self._composer.construct(list(self._node_events()))
+
+    def _skip_value(self) -> None:
+        for _ in self._node_events():
+            pass
+
+    def _rewind_to_goods(self) -> None:
+        """
+        Перечитывает файл с начала и останавливается на разделе goods.
+        """
+        self._stream.seek(0)
+        self._open()
+        while not self._loader.check_event(MappingEndEvent):
+            if self._read_value() == 'goods':
+                self._goods_pending = True
+                return
+            self._skip_value()
+
+    def goods(self) -> Iterator[dict]:
+        """
+        Отдает товары из раздела goods по одному.
+
+        Yields:
+            dict: очередной товар прайса
+        """
+        if self._goods_skipped:
+            self._goods_skipped = False
+            self._rewind_to_goods()
+        if not self._goods_pending:
+            return
+        self._goods_pending = False
+        if self._loader.check_event(ScalarEvent): # пустой раздел goods
+            self._loader.get_event()
+            return
+        if not self._loader.check_event(SequenceStartEvent):
+            raise ValueError('Раздел goods должен быть списком')
+        self._loader.get_event()
+        while not self._loader.check_event(SequenceEndEvent):
+            yield self._read_value()
+        self._loader.get_event()
+
+
+def open_price_list(source: str) -> IO[bytes]:
+    """
+    Открывает прайс для потокового чтения (PriceListReader). Используется при параллельном
+    импорте (manage.py import_feeds): каждый процесс сам скачивает и разбирает свой прайс,
+    поэтому товары не накапливаются в памяти и не передаются между процессами.
+
+    Args:
+        source (str): url или путь к yaml-файлу прайса
+
+    Returns:
+        IO[bytes]: временный файл со скачанным прайсом или открытый файл; закрывает вызывающий код
+    """
+    if source.startswith(('http://', 'https://')):
+        return fetch_price_list(source).file
+    return open(source, 'rb')
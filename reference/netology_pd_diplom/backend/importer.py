@@ -0,0 +1,427 @@
+"""
+Движок импорта прайс-листов партнёров.
+
+Вместо get_or_create/create на каждый товар и параметр справочники
+(категории, продукты, имена параметров) загружаются в словари один раз,
+а ProductInfo и ProductParameter записываются пакетами через bulk_create.
+Число запросов к БД зависит от числа пакетов, а не от числа товаров.
+
+Прайс синхронизируется с каталогом магазина по ключу (магазин, external_id):
+создаются только новые позиции, обновляются только изменившиеся,
+а удаляются только позиции, которых больше нет в прайсе (позиции оформленных
+заказов не удаляются, а остаются с нулевым остатком).
+
+В режиме dry_run импорт ничего не записывает, а только составляет план
+изменений (ImportPlan): прайс сравнивается с загруженным в словари каталогом
+операциями над множествами external_id, без запросов на каждую позицию.
+"""
+from dataclasses import dataclass, asdict, field
+from itertools import islice
+from time import monotonic
+from typing import Callable, Iterable, Iterator, Optional
+
+from django.db import transaction
+
+from backend.basket import recalculate_order_totals
+from backend.catalog import render_parameters, save_catalog_entries
+from backend.facets import rebuild_facets
+from backend.models import Shop, Category, Product, ProductInfo, Parameter, ProductParameter, CatalogEntry, OrderItem
+from backend.search import update_search_index
+from backend.signals import catalog_changed
+
+BATCH_SIZE = 1000 # количество товаров в одном пакете записи
+PLAN_LIMIT = 100 # сколько позиций каждого вида изменений перечислять в плане dry_run
+
+
+def chunked(iterable: Iterable, size: int) -> Iterator[list]:
+    """
+    Разбивает последовательность на списки длиной не более size.
+
+    Args:
+        iterable: исходная последовательность (может быть генератором)
+        size (int): размер пакета
+
+    Yields:
+        list: очередной пакет элементов
+    """
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+@dataclass
+class ImportStats:
+    """
+    Статистика импорта прайс-листа.
+    """
+    parsed: int = 0 # товаров прочитано из прайса
+    created: int = 0 # позиций ProductInfo создано
+    updated: int = 0 # позиций ProductInfo изменено (поля или параметры)
+    deleted: int = 0 # позиций ProductInfo удалено
+    unchanged: int = 0 # позиций ProductInfo без изменений
+    failed: int = 0 # товаров пропущено из-за ошибок в данных
+    price_changed: int = 0 # позиций с изменившейся ценой (price или price_rrc)
+    quantity_changed: int = 0 # позиций с изменившимся остатком
+    elapsed: float = 0.0 # время импорта в секундах
+    not_modified: bool = False # прайс не изменился с прошлого импорта и не разбирался
+    dry_run: bool = False # изменения не записывались, составлен только план
+
+    @property
+    def written(self) -> int:
+        """Количество записанных (созданных и измененных) позиций."""
+        return self.created + self.updated
+
+    def as_dict(self) -> dict:
+        return {**asdict(self), 'written': self.written}
+
+
+@dataclass
+class ImportPlan:
+    """
+    План изменений каталога, составленный в режиме dry_run.
+    В каждом списке не больше PLAN_LIMIT позиций, полное количество - в ImportStats.
+    """
+    created: list = field(default_factory=list) # external_id новых позиций
+    price_changed: list = field(default_factory=list) # {'id': ..., 'price': [было, стало], 'price_rrc': [было, стало]}
+    quantity_changed: list = field(default_factory=list) # {'id': ..., 'quantity': [было, стало]}
+    deleted: list = field(default_factory=list) # external_id позиций, которых нет в прайсе
+
+    def add(self, kind: str, value) -> None:
+        changes = getattr(self, kind)
+        if len(changes) < PLAN_LIMIT:
+            changes.append(value)
+
+    def as_dict(self) -> dict:
+        return asdict(self)
+
+
+class PriceListImporter:
+    """
+    Импорт прайс-листа одного магазина пакетными запросами.
+
+    Attributes:
+        shop (Shop): магазин, прайс которого обновляется
+        batch_size (int): количество товаров в одном пакете bulk_create
+        progress (callable): вызывается со статистикой после каждого пакета
+        dry_run (bool): ничего не записывать, только составить план изменений (plan)
+    """
+    # поля ProductInfo, которые сравниваются с прайсом при синхронизации
+    fields = ('product_id', 'model', 'price', 'price_rrc', 'quantity')
+
+    def __init__(self, shop: Shop, batch_size: int = BATCH_SIZE,
+                 progress: Optional[Callable[[ImportStats], None]] = None, dry_run: bool = False):
+        self.shop = shop
+        self.batch_size = batch_size
+        self.progress = progress
+        self.dry_run = dry_run
+        self.stats = ImportStats(dry_run=dry_run)
+        self.plan = ImportPlan()
+        self._started = monotonic()
+        self._categories = {} # id -> название всех известных категорий
+        self._products = {} # (название, id категории) -> id продукта
+        self._parameters = {} # название параметра -> id параметра
+        self._offers = {} # external_id -> (id ProductInfo, значения полей fields)
+        self._offer_parameters = {} # id ProductInfo -> {id параметра: (id ProductParameter, значение)}
+        self._seen = set() # external_id позиций, встретившихся в прайсе
+
+    def run(self, categories: Iterable[dict], goods: Iterable[dict]) -> ImportStats:
+        """
+        Синхронизирует категории и товары магазина с прайсом в одной транзакции.
+
+        Args:
+            categories: категории из прайса ({'id': ..., 'name': ...})
+            goods: товары из прайса (может быть генератором)
+
+        Returns:
+            ImportStats: статистика импорта
+        """
+        self._started = monotonic()
+        with transaction.atomic():
+            category_ids = self.import_categories(categories)
+            self._preload(category_ids)
+            for chunk in chunked(goods, self.batch_size):
+                self.import_goods(chunk)
+                self._report()
+            self.delete_missing()
+            if not self.dry_run:
+                rebuild_facets(self.shop.id) # счетчики фасетного фильтра каталога
+                # сбросить кеш каталога после фиксации транзакции (в т.ч. внешней)
+                transaction.on_commit(lambda: catalog_changed.send(sender=self.__class__, shop_id=self.shop.id))
+        self._report()
+        return self.stats
+
+    def _report(self) -> None:
+        self.stats.elapsed = round(monotonic() - self._started, 3)
+        if self.progress:
+            self.progress(self.stats)
+
+    def import_categories(self, categories: Iterable[dict]) -> list:
+        """
+        Создает недостающие категории, переименовывает изменившиеся
+        и привязывает их к магазину.
+
+        Returns:
+            list: id категорий прайса
+        """
+        names = {category['id']: category['name'] for category in categories}
+        if self.dry_run:
+            return list(names)
+        existing = Category.objects.in_bulk(list(names))
+        Category.objects.bulk_create(
+            [Category(id=category_id, name=name) for category_id, name in names.items()
+             if category_id not in existing], ignore_conflicts=True) # категорию мог создать параллельный импорт
+        renamed = [category for category_id, category in existing.items() if category.name != names[category_id]]
+        if renamed:
+            # название категории есть в каталоге всех магазинов с ее товарами: их кеш тоже устаревает
+            shop_ids = set(CatalogEntry.objects.filter(category_id__in=[category.id for category in renamed]).exclude(
+                shop_id=self.shop.id).values_list('shop_id', flat=True).distinct())
+
+            def committed():
+                for shop_id in shop_ids:
+                    catalog_changed.send(sender=self.__class__, shop_id=shop_id)
+
+            transaction.on_commit(committed)
+        for category in renamed:
+            category.name = names[category.id]
+            CatalogEntry.objects.filter(category_id=category.id).update(category_name=category.name)
+        Category.objects.bulk_update(renamed, ['name'])
+        self.shop.categories.add(*names) # добавляем магазин в категории (один запрос на выборку и один на вставку)
+        return list(names)
+
+    def _preload(self, category_ids: list) -> None:
+        """
+        Загружает в словари продукты категорий прайса, имена параметров
+        и текущий каталог магазина (позиции и значения их параметров).
+        """
+        self._products = {(name, category_id): product_id for name, category_id, product_id in
+                          Product.objects.filter(category_id__in=category_ids).values_list('name', 'category_id', 'id')}
+        self._parameters = dict(Parameter.objects.values_list('name', 'id'))
+        self._categories = dict(Category.objects.values_list('id', 'name'))
+        if self.dry_run: # категории прайса при dry_run не создаются, но товары в них считаются корректными
+            self._categories = {category_id: '' for category_id in category_ids} | self._categories
+        if self.shop.pk is None: # новый магазин при dry_run еще не сохранен, каталога у него нет
+            return
+        self._offers = {row[1]: (row[0], row[2:]) for row in ProductInfo.objects.filter(
+            shop_id=self.shop.id).values_list('id', 'external_id', *self.fields).iterator(chunk_size=self.batch_size)}
+        for pk, product_info_id, parameter_id, value in ProductParameter.objects.filter(
+                product_info__shop_id=self.shop.id).values_list(
+                'id', 'product_info_id', 'parameter_id', 'value').iterator(chunk_size=self.batch_size):
+            self._offer_parameters.setdefault(product_info_id, {})[parameter_id] = (pk, value)
+
+    def _product_ids(self, chunk: list) -> None:
+        """
+        Создает продукты пакета, которых еще нет в словаре, и загружает их id.
+        Продукт мог создать параллельный импорт другого прайса: вставка пропускает
+        конфликты по unique_product, а id читаются повторным запросом.
+        """
+        missing = {(item['name'], item['category']) for item in chunk} - self._products.keys()
+        if not missing:
+            return
+        Product.objects.bulk_create([Product(name=name, category_id=category_id) for name, category_id in missing],
+                                    ignore_conflicts=True)
+        products = Product.objects.filter(name__in={name for name, _ in missing}).values_list('name', 'category_id', 'id')
+        self._products.update({(name, category_id): product_id for name, category_id, product_id in products
+                               if (name, category_id) in missing})
+
+    def _parameter_ids(self, chunk: list) -> None:
+        """
+        Создает имена параметров пакета, которых еще нет в словаре, и загружает их id
+        (конфликты с параллельным импортом по unique_parameter пропускаются, как у продуктов).
+        """
+        missing = {name for item in chunk for name in item['parameters']} - self._parameters.keys()
+        if not missing:
+            return
+        Parameter.objects.bulk_create([Parameter(name=name) for name in missing], ignore_conflicts=True)
+        self._parameters.update(Parameter.objects.filter(name__in=missing).values_list('name', 'id'))
+
+    def _is_valid(self, item) -> bool:
+        """
+        Проверяет, что товар из прайса можно записать в каталог.
+        """
+        try:
+            return (isinstance(item['id'], int) and item['category'] in self._categories
+                    and all(isinstance(item[key], int) and item[key] >= 0 for key in ('price', 'price_rrc', 'quantity'))
+                    and isinstance(item['name'], str) and 0 < len(item['name']) <= 80
+                    and len(str(item['model'])) <= 80
+                    and isinstance(item['parameters'], dict)
+                    and all(isinstance(name, str) and len(name) <= 40 and len(str(value)) <= 100
+                            for name, value in item['parameters'].items()))
+        except (KeyError, TypeError):
+            return False
+
+    def _values(self, item: dict) -> tuple:
+        """
+        Значения полей fields позиции из прайса в том виде, в котором они хранятся в БД.
+        """
+        return (self._products[(item['name'], item['category'])], str(item['model']),
+                item['price'], item['price_rrc'], item['quantity'])
+
+    def _parameter_values(self, item: dict) -> dict:
+        """
+        Параметры позиции из прайса: {id параметра: значение строкой}.
+        """
+        return {self._parameters[name]: str(value) for name, value in item['parameters'].items()}
+
+    def import_goods(self, chunk: list) -> None:
+        """
+        Сравнивает пакет товаров с текущим каталогом магазина и записывает только разницу:
+        новые позиции - bulk_create, изменившиеся - bulk_update, параметры - тем же способом.
+        """
+        self.stats.parsed += len(chunk)
+        valid = [item for item in chunk if self._is_valid(item)]
+        self.stats.failed += len(chunk) - len(valid)
+        chunk = valid
+        if self.dry_run:
+            self._plan_goods(chunk)
+            return
+        self._product_ids(chunk)
+        self._parameter_ids(chunk)
+
+        new_items = [] # товары, которых еще нет в каталоге магазина
+        updated_items = [] # (id ProductInfo, товар) изменившихся позиций
+        changed_offers = [] # ProductInfo с изменившимися полями
+        new_parameters, changed_parameters, removed_parameters = [], [], []
+        for item in chunk:
+            if item['id'] in self._seen: # повторное вхождение external_id в прайсе считаем ошибкой
+                self.stats.failed += 1
+                continue
+            self._seen.add(item['id'])
+            values = self._values(item)
+            if item['id'] not in self._offers:
+                new_items.append((item, values))
+                continue
+
+            product_info_id, stored_values = self._offers[item['id']]
+            changed = values != stored_values
+            if changed:
+                self._count_changes(dict(zip(self.fields, stored_values)), item)
+                changed_offers.append(ProductInfo(id=product_info_id, **dict(zip(self.fields, values))))
+
+            stored_parameters = self._offer_parameters.get(product_info_id, {})
+            parameters = self._parameter_values(item)
+            for parameter_id, value in parameters.items():
+                if parameter_id not in stored_parameters:
+                    new_parameters.append(ProductParameter(product_info_id=product_info_id,
+                                                           parameter_id=parameter_id, value=value))
+                elif stored_parameters[parameter_id][1] != value:
+                    changed_parameters.append(ProductParameter(id=stored_parameters[parameter_id][0], value=value))
+                else:
+                    continue
+                changed = True
+            removed = [pk for parameter_id, (pk, _) in stored_parameters.items() if parameter_id not in parameters]
+            removed_parameters.extend(removed)
+
+            if changed or removed:
+                self.stats.updated += 1
+                updated_items.append((product_info_id, item))
+            else:
+                self.stats.unchanged += 1
+
+        product_infos = ProductInfo.objects.bulk_create([
+            ProductInfo(external_id=item['id'], shop_id=self.shop.id, **dict(zip(self.fields, values)))
+            for item, values in new_items]) # на SQLite и PostgreSQL bulk_create возвращает id
+        new_parameters.extend(
+            ProductParameter(product_info_id=product_info.id, parameter_id=parameter_id, value=value)
+            for product_info, (item, _) in zip(product_infos, new_items)
+            for parameter_id, value in self._parameter_values(item).items())
+        self.stats.created += len(product_infos)
+
+        ProductInfo.objects.bulk_update(changed_offers, self.fields, batch_size=self.batch_size)
+        touched = [(product_info.id, item) for product_info, (item, _) in zip(product_infos, new_items)] + updated_items
+        # модель каталога для чтения и поисковый индекс: новые и изменившиеся позиции
+        save_catalog_entries([self._catalog_entry(product_info_id, item) for product_info_id, item in touched])
+        update_search_index([product_info_id for product_info_id, _ in touched])
+        ProductParameter.objects.bulk_update(changed_parameters, ['value'], batch_size=self.batch_size)
+        if removed_parameters:
+            ProductParameter.objects.filter(id__in=removed_parameters).delete()
+        ProductParameter.objects.bulk_create(new_parameters)
+
+    def _count_changes(self, stored: dict, item: dict) -> None:
+        """
+        Учитывает изменение цены и остатка позиции в статистике (и в плане при dry_run).
+        """
+        if (stored['price'], stored['price_rrc']) != (item['price'], item['price_rrc']):
+            self.stats.price_changed += 1
+            if self.dry_run:
+                self.plan.add('price_changed', {'id': item['id'], 'price': [stored['price'], item['price']],
+                                                'price_rrc': [stored['price_rrc'], item['price_rrc']]})
+        if stored['quantity'] != item['quantity']:
+            self.stats.quantity_changed += 1
+            if self.dry_run:
+                self.plan.add('quantity_changed', {'id': item['id'], 'quantity': [stored['quantity'], item['quantity']]})
+
+    def _plan_goods(self, chunk: list) -> None:
+        """
+        Сравнивает пакет товаров с каталогом магазина, ничего не записывая.
+        Новые и существующие позиции определяются разностью и пересечением множеств external_id.
+        """
+        items = {}
+        for item in chunk:
+            if item['id'] in self._seen or item['id'] in items: # повторное вхождение external_id
+                self.stats.failed += 1
+            else:
+                items[item['id']] = item
+        self._seen.update(items)
+
+        created = items.keys() - self._offers.keys()
+        self.stats.created += len(created)
+        for external_id in sorted(created):
+            self.plan.add('created', external_id)
+
+        for external_id in sorted(items.keys() & self._offers.keys()):
+            item = items[external_id]
+            product_info_id, stored_values = self._offers[external_id]
+            stored = dict(zip(self.fields, stored_values))
+            self._count_changes(stored, item)
+            # продукт и имена параметров, которых еще нет в БД, дают None и считаются изменением
+            values = (self._products.get((item['name'], item['category'])), str(item['model']),
+                      item['price'], item['price_rrc'], item['quantity'])
+            parameters = {self._parameters.get(name): str(value) for name, value in item['parameters'].items()}
+            stored_parameters = {parameter_id: value for parameter_id, (_, value)
+                                 in self._offer_parameters.get(product_info_id, {}).items()}
+            if values != stored_values or parameters != stored_parameters:
+                self.stats.updated += 1
+            else:
+                self.stats.unchanged += 1
+
+    def _catalog_entry(self, product_info_id: int, item: dict) -> CatalogEntry:
+        """
+        Запись модели каталога для чтения, собранная из товара прайса без запросов к БД.
+        """
+        return CatalogEntry(product_info_id=product_info_id, shop_id=self.shop.id, shop_name=self.shop.name,
+                            category_id=item['category'], category_name=self._categories[item['category']],
+                            product_name=item['name'], model=str(item['model']), quantity=item['quantity'],
+                            price=item['price'], price_rrc=item['price_rrc'],
+                            parameters=render_parameters(item['parameters'].items()))
+
+    def delete_missing(self) -> None:
+        """
+        Снимает с продажи позиции магазина, которых нет в прайсе. Позиции, на которые ссылаются
+        оформленные заказы, остаются с нулевым остатком (удаление каскадом удалило бы строки заказов),
+        остальные удаляются. Из корзин такие позиции удаляются в обоих случаях.
+        """
+        missing = {self._offers[external_id][0]: external_id for external_id in self._offers.keys() - self._seen}
+        quantity = self.fields.index('quantity')
+        for chunk in chunked(sorted(missing, key=missing.get), self.batch_size):
+            ordered = set(OrderItem.objects.filter(product_info_id__in=chunk).exclude(order__state='basket').values_list(
+                'product_info_id', flat=True).distinct())
+            deleted = [product_info_id for product_info_id in chunk if product_info_id not in ordered]
+            # позиция, уже снятая с продажи прошлым импортом, не считается снова
+            retired = [product_info_id for product_info_id in chunk if product_info_id in ordered
+                       and self._offers[missing[product_info_id]][1][quantity]]
+            self.stats.deleted += len(deleted) + len(retired)
+            if self.dry_run:
+                for product_info_id in deleted + retired:
+                    self.plan.add('deleted', missing[product_info_id])
+                continue
+            # суммы корзин с этими позициями пересчитываются
+            baskets = list(OrderItem.objects.filter(product_info_id__in=chunk, order__state='basket').values_list(
+                'order_id', flat=True).distinct())
+            OrderItem.objects.filter(product_info_id__in=ordered, order__state='basket').delete()
+            ProductInfo.objects.filter(id__in=ordered).update(quantity=0)
+            CatalogEntry.objects.filter(product_info_id__in=ordered).update(quantity=0)
+            ProductInfo.objects.filter(id__in=deleted).delete() # позиции корзин удаляются каскадно
+            recalculate_order_totals(baskets)
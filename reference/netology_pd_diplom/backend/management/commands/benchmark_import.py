@@ -0,0 +1,92 @@
+"""
+Замер производительности импорта прайс-листов на синтетических прайсах.
+
+Пример:
+    python manage.py benchmark_import --sizes 1000 10000 100000 1000000 --output bench.json
+
+Каждый размер прайса замеряется в отдельном процессе на чистой тестовой БД,
+чтобы пиковый объем памяти (peak_rss_kb) относился только к этому замеру.
+Замеряется первичный импорт (import) и повторный импорт того же прайса (reimport).
+Результаты записываются в JSON для сравнения между релизами.
+"""
+import json
+import os
+import subprocess
+import sys
+from datetime import datetime, timezone
+from tempfile import TemporaryDirectory
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from backend.benchmark import measure_import, peak_rss, write_price_list
+from backend.importer import BATCH_SIZE
+from backend.management.commands.generate_feed import add_feed_arguments, feed_options
+
+
+class Command(BaseCommand):
+    help = 'Замер времени, числа запросов и памяти при импорте синтетических прайс-листов'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000, 1000000],
+                            help='количество товаров в замеряемых прайсах')
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE,
+                            help='количество товаров в одном пакете записи')
+        parser.add_argument('--output', help='путь к JSON-файлу с результатами (по умолчанию - stdout)')
+        add_feed_arguments(parser, goods=False)
+        parser.add_argument('--goods', type=int, help='выполнить один замер в текущем процессе')
+
+    def handle(self, *args, **options):
+        if options['goods'] is not None:
+            self.stdout.write(json.dumps(self.measure(options)))
+            return
+
+        results = []
+        for size in options['sizes']:
+            command = [sys.executable, os.path.join(settings.BASE_DIR, 'manage.py'), 'benchmark_import',
+                       '--goods', str(size), '--batch-size', str(options['batch_size'])]
+            for key in ('categories', 'parameters', 'skew', 'seed'):
+                command += [f'--{key}', str(options[key])]
+            process = subprocess.run(command, capture_output=True, text=True)
+            if process.returncode:
+                raise CommandError(f'Замер на {size} товаров завершился с ошибкой:\n{process.stderr}')
+            results.append(json.loads(process.stdout.strip().splitlines()[-1]))
+            self.stderr.write(f'{size}: импорт {results[-1]["import"]["wall_time"]} с, '
+                              f'{results[-1]["import"]["queries"]} запросов, {results[-1]["peak_rss_kb"]} КБ')
+
+        report = {
+            'created_at': datetime.now(timezone.utc).isoformat(),
+            'python': sys.version.split()[0],
+            'django': django.get_version(),
+            'database': connection.vendor,
+            'options': {key: options[key] for key in ('batch_size', 'categories', 'parameters', 'skew', 'seed')},
+            'results': results,
+        }
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                json.dump(report, file, ensure_ascii=False, indent=2)
+        else:
+            self.stdout.write(json.dumps(report, ensure_ascii=False, indent=2))
+
+    def measure(self, options: dict) -> dict:
+        """
+        Один замер: генерирует прайс, импортирует его в чистую тестовую БД дважды.
+        """
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            with TemporaryDirectory() as directory:
+                path = os.path.join(directory, 'feed.yaml')
+                with open(path, 'w', encoding='utf-8') as file:
+                    write_price_list(file, **feed_options(options))
+                return {
+                    'goods': options['goods'],
+                    'feed_bytes': os.path.getsize(path),
+                    'import': measure_import(path, options['batch_size']),
+                    'reimport': measure_import(path, options['batch_size']),
+                    'peak_rss_kb': peak_rss(),
+                }
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
@@ -0,0 +1,39 @@
+"""
+Генерация синтетического прайс-листа для нагрузочных тестов импорта.
+
+Пример:
+    python manage.py generate_feed feed.yaml --goods 100000 --categories 50 --parameters 8 --skew 1.2
+"""
+from django.core.management.base import BaseCommand
+
+from backend.benchmark import write_price_list
+
+
+class Command(BaseCommand):
+    help = 'Генерация синтетического прайс-листа в формате data/shop1.yaml'
+
+    def add_arguments(self, parser):
+        parser.add_argument('output', help='путь к создаваемому yaml-файлу')
+        add_feed_arguments(parser)
+
+    def handle(self, *args, **options):
+        with open(options['output'], 'w', encoding='utf-8') as file:
+            write_price_list(file, **feed_options(options))
+        self.stdout.write(self.style.SUCCESS(f'Прайс на {options["goods"]} товаров записан в {options["output"]}'))
+
+
+def add_feed_arguments(parser, goods: bool = True) -> None:
+    """
+    Параметры синтетического прайса (общие для generate_feed и benchmark_import).
+    """
+    if goods:
+        parser.add_argument('--goods', type=int, default=1000, help='количество товаров')
+    parser.add_argument('--categories', type=int, default=10, help='количество категорий')
+    parser.add_argument('--parameters', type=int, default=5, help='количество параметров у товара')
+    parser.add_argument('--skew', type=float, default=1.0,
+                        help='перекос распределения товаров по категориям (0 - равномерно)')
+    parser.add_argument('--seed', type=int, default=0, help='начальное значение генератора случайных чисел')
+
+
+def feed_options(options: dict) -> dict:
+    return {key: options[key] for key in ('goods', 'categories', 'parameters', 'skew', 'seed')}
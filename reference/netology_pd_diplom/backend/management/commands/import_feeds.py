@@ -0,0 +1,110 @@
+"""
+Параллельный импорт прайс-листов нескольких магазинов.
+
+Пример:
+    python manage.py import_feeds data/shop1.yaml https://example.com/shop2.yaml --workers 4
+
+Каждый прайс импортируется целиком в одном процессе пула (--workers): процесс сам
+скачивает прайс во временный файл, разбирает его потоково (PriceListReader) и передает
+товары по одному тому же движку, что и PartnerUpdate (PriceListImporter). Товары не
+накапливаются в памяти и не передаются между процессами, поэтому расход памяти
+не зависит от размера прайсов. На PostgreSQL каждый прайс пишется в своей транзакции
+и блокирует только строки своего магазина. SQLite допускает только одного пишущего,
+поэтому для нее прайсы импортируются по очереди в текущем процессе.
+"""
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+
+from backend.feed import PriceListReader, open_price_list
+from backend.importer import BATCH_SIZE, PriceListImporter
+from backend.models import Shop
+
+
+def _init_worker() -> None:
+    # процесс пула, запущенный через spawn (macOS, Windows), сам настраивает Django
+    django.setup()
+
+
+def import_source(source: str, batch_size: int, dry_run: bool) -> tuple:
+    """
+    Импортирует один прайс потоково. Выполняется в процессе пула (или в текущем процессе для SQLite).
+
+    Args:
+        source (str): url или путь к yaml-файлу прайса
+        batch_size (int): количество товаров в одном пакете записи
+        dry_run (bool): ничего не записывать, только составить план изменений
+
+    Returns:
+        tuple: название магазина, статистика импорта и план изменений (при dry_run)
+    """
+    with open_price_list(source) as stream:
+        reader = PriceListReader(stream)
+        shop = Shop.objects.filter(name=reader.shop).first()
+        if shop is None:
+            shop = Shop(name=reader.shop) if dry_run else Shop.objects.create(name=reader.shop)
+        importer = PriceListImporter(shop, batch_size, dry_run=dry_run)
+        stats = importer.run(reader.categories, reader.goods())
+        return shop.name, stats, importer.plan
+
+
+class Command(BaseCommand):
+    help = 'Параллельный импорт прайс-листов магазинов из файлов или по url'
+
+    def add_arguments(self, parser):
+        parser.add_argument('sources', nargs='+', help='пути к yaml-файлам или url прайс-листов')
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                            help='количество процессов импорта (для SQLite всегда 1)')
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE,
+                            help='количество товаров в одном пакете записи')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='ничего не записывать, только показать план изменений')
+
+    def handle(self, *args, **options):
+        sources = options['sources']
+        workers = max(1, min(options['workers'], len(sources)))
+        batch_size, dry_run = options['batch_size'], options['dry_run']
+
+        errors = []
+        if connection.vendor == 'sqlite': # SQLite блокирует всю базу на запись: прайсы по очереди
+            results = []
+            for source in sources:
+                try:
+                    results.append((source, import_source(source, batch_size, dry_run), None))
+                except Exception as error:
+                    results.append((source, None, error))
+        else:
+            connections.close_all() # процессы пула открывают свои соединения, а не наследуют открытые
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+                futures = {pool.submit(import_source, source, batch_size, dry_run): source for source in sources}
+                results = []
+                for future in as_completed(futures):
+                    try:
+                        results.append((futures[future], future.result(), None))
+                    except Exception as error:
+                        results.append((futures[future], None, error))
+
+        for source, result, error in results:
+            if error is not None:
+                errors.append(source)
+                self.stderr.write(f'{source}: ошибка импорта прайса: {error}')
+                continue
+            shop, stats, plan = result
+            self.stdout.write(f'{source}: {shop}: прочитано {stats.parsed}, создано {stats.created}, '
+                              f'изменено {stats.updated}, удалено {stats.deleted}, '
+                              f'с ошибками {stats.failed} за {stats.elapsed} с')
+            if dry_run:
+                self.stdout.write(f'  план: изменение цены {stats.price_changed}, '
+                                  f'изменение остатка {stats.quantity_changed}')
+                for kind, changes in plan.as_dict().items():
+                    for change in changes:
+                        self.stdout.write(f'  {kind}: {change}')
+
+        if dry_run:
+            self.stdout.write('Режим --dry-run: изменения не записаны')
+        if errors:
+            raise CommandError(f'Не удалось импортировать прайсов: {len(errors)} из {len(sources)}')
+        self.stdout.write(self.style.SUCCESS(f'Импортировано прайсов: {len(sources)}'))
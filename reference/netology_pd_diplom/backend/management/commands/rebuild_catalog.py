@@ -0,0 +1,19 @@
+"""
+Перестроение модели каталога для чтения (см. backend/catalog.py).
+
+Пример:
+    python manage.py rebuild_catalog
+"""
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from backend.catalog import rebuild_catalog
+
+
+class Command(BaseCommand):
+    help = 'Перестроение плоских записей каталога (CatalogEntry) по ProductInfo'
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            count = rebuild_catalog()
+        self.stdout.write(self.style.SUCCESS(f'Записей каталога: {count}'))
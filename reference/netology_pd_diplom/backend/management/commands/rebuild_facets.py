@@ -0,0 +1,22 @@
+"""
+Пересчет счетчиков фасетного фильтра каталога (см. backend/facets.py).
+
+Пример:
+    python manage.py rebuild_facets
+"""
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from backend.facets import rebuild_facets
+from backend.models import Shop
+
+
+class Command(BaseCommand):
+    help = 'Пересчет счетчиков фасетного фильтра каталога по всем магазинам'
+
+    def handle(self, *args, **options):
+        shop_ids = list(Shop.objects.values_list('id', flat=True))
+        for shop_id in shop_ids:
+            with transaction.atomic():
+                rebuild_facets(shop_id)
+        self.stdout.write(self.style.SUCCESS(f'Пересчитаны фасеты магазинов: {len(shop_ids)}'))
@@ -0,0 +1,19 @@
+"""
+Перестроение полнотекстового индекса каталога (см. backend/search.py).
+
+Пример:
+    python manage.py rebuild_search_index
+"""
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from backend.search import rebuild_search_index
+
+
+class Command(BaseCommand):
+    help = 'Перестроение полнотекстового индекса каталога по названию продукта и модели'
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            count = rebuild_search_index()
+        self.stdout.write(self.style.SUCCESS(f'Проиндексировано позиций: {count}'))
@@ -0,0 +1,113 @@
+"""
+Сжатие ответов по заголовку Accept-Encoding.
+
+Кодирование выбирается по предпочтениям клиента: brotli (пакет Brotli из
+requirements.txt), иначе gzip. Ответы меньше COMPRESSION_MIN_SIZE байт не сжимаются:
+на маленьких ответах выигрыш в размере меньше затрат на сжатие.
+Потоковые ответы (выгрузка каталога) сжимаются по частям, не накапливаясь в памяти.
+
+HTML (страницы Browsable API с CSRF-токеном) не сжимается: сжатие страницы, в которой
+секрет соседствует с данными из запроса, открывает ее для атаки BREACH.
+"""
+import re
+from typing import Iterator, Optional
+
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+from django.utils.text import compress_sequence, compress_string
+
+try:
+    import brotli # в requirements.txt; если пакет не установлен, ответы сжимаются только gzip
+except ImportError:
+    brotli = None
+
+COMPRESSION_MIN_SIZE = 1024 # минимальный размер сжимаемого ответа, байт (настройка COMPRESSION_MIN_SIZE)
+BROTLI_QUALITY = 5 # уровень сжатия brotli для ответов, которые формируются на каждый запрос (максимум 11 - для статики)
+# сжимаются только ответы API (JSON) и выгрузки каталога (yaml/ndjson/csv), но не HTML (см. выше)
+COMPRESSIBLE_TYPES = ('application/json', 'application/x-yaml', 'application/x-ndjson', 'text/csv')
+
+_ACCEPT_ENCODING = re.compile(r'\s*([\w*-]+)\s*(?:;\s*q\s*=\s*([0-9.]+))?\s*(?:,|$)')
+
+
+def choose_encoding(accept_encoding: str) -> Optional[str]:
+    """
+    Выбирает кодирование ответа по заголовку Accept-Encoding.
+
+    Args:
+        accept_encoding (str): значение заголовка, например 'gzip, deflate, br;q=0.9'
+
+    Returns:
+        str: 'br', 'gzip' или None, если клиент не принимает ни одно из них
+    """
+    weights = {}
+    for coding, q in _ACCEPT_ENCODING.findall(accept_encoding.lower()):
+        try:
+            weights[coding] = float(q) if q else 1.0
+        except ValueError:
+            continue
+    available = ('br', 'gzip') if brotli is not None else ('gzip',)
+    default = weights.get('*', 0) # '*' - любое кодирование, не названное явно
+    candidates = [(weights.get(coding, default), -index, coding) for index, coding in enumerate(available)]
+    weight, _, coding = max(candidates) # при равном весе предпочитаем brotli
+    return coding if weight > 0 else None
+
+
+def _compress(content: bytes, encoding: str) -> bytes:
+    if encoding == 'br':
+        return brotli.compress(content, quality=BROTLI_QUALITY)
+    return compress_string(content)
+
+
+def _compress_stream(chunks: Iterator[bytes], encoding: str) -> Iterator[bytes]:
+    if encoding == 'gzip':
+        yield from compress_sequence(chunks)
+        return
+    compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+    for chunk in chunks:
+        data = compressor.process(chunk) + compressor.flush() # каждую часть отдаем клиенту сразу
+        if data:
+            yield data
+    yield compressor.finish()
+
+
+class CompressionMiddleware:
+    """
+    Сжимает ответы brotli или gzip. В MIDDLEWARE должен стоять первым, чтобы
+    сжимать ответ после всех остальных middleware, которые читают или меняют тело.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.min_size = getattr(settings, 'COMPRESSION_MIN_SIZE', COMPRESSION_MIN_SIZE)
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if response.has_header('Content-Encoding'):
+            return response
+        if not response.get('Content-Type', '').startswith(COMPRESSIBLE_TYPES):
+            return response
+        if not response.streaming and len(response.content) < self.min_size:
+            return response
+        if response.streaming and response.is_async: # асинхронные потоки не сжимаем
+            return response
+
+        patch_vary_headers(response, ('Accept-Encoding',)) # ответ зависит от Accept-Encoding и для кешей
+        encoding = choose_encoding(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        if encoding is None:
+            return response
+
+        if response.streaming:
+            response.streaming_content = _compress_stream(response.streaming_content, encoding)
+            del response['Content-Length'] # длина сжатого потока заранее неизвестна
+        else:
+            compressed = _compress(response.content, encoding)
+            if len(compressed) >= len(response.content): # несжимаемые данные отдаем как есть
+                return response
+            response.content = compressed
+            response.headers['Content-Length'] = str(len(compressed))
+
+        # сжатое тело отличается от исходного побайтно, поэтому строгий ETag становится слабым
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response.headers['ETag'] = 'W/' + etag
+        response.headers['Content-Encoding'] = encoding
+        return response
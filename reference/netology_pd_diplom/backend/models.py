@@ -189,6 +189,11 @@ class Shop(models.Model):
                                 blank=True, null=True,
                                 on_delete=models.CASCADE)
     state = models.BooleanField(verbose_name=_('статус получения заказов'), default=True) 
+    # Сведения о последнем загруженном прайсе (url хранится в поле url): по ним прайс
+    # запрашивается условным GET и не импортируется повторно, если не изменился
+    feed_etag = models.CharField(verbose_name=_('ETag прайса'), max_length=255, blank=True)
+    feed_last_modified = models.CharField(verbose_name=_('Last-Modified прайса'), max_length=64, blank=True)
+    feed_digest = models.CharField(verbose_name=_('SHA-256 прайса'), max_length=64, blank=True)
 
     # filename
 
@@ -225,6 +230,9 @@ class Product(models.Model):
         verbose_name = _('Продукт')
         verbose_name_plural = _('Список продуктов')
         ordering = ('-name',)
+        constraints = [
+            models.UniqueConstraint(fields=['name', 'category'], name='unique_product'),
+        ] # продукт общий для магазинов: параллельные импорты не создают его дважды
 
     def __str__(self):
         return self.name
@@ -247,7 +255,13 @@ class ProductInfo(models.Model):
         verbose_name_plural = _("Информационный список о продуктах")
         constraints = [
             models.UniqueConstraint(fields=['product', 'shop', 'external_id'], name='unique_product_info'),
+            # ключ синхронизации с прайсом (см. backend/importer.py)
+            models.UniqueConstraint(fields=['shop', 'external_id'], name='unique_shop_external_id'),
         ] # дополнительная защита от дубликатов 
+        indexes = [
+            models.Index(fields=['shop', 'price'], name='product_info_shop_price_idx'),
+            models.Index(fields=['product', 'price'], name='product_info_product_price_idx'),
+        ] # предложения магазина и предложения продукта по цене
 
 
 class Parameter(models.Model):
@@ -258,6 +272,9 @@ class Parameter(models.Model):
         verbose_name = _('Имя параметра')
         verbose_name_plural = _('Список имен параметров')
         ordering = ('-name',)
+        constraints = [
+            models.UniqueConstraint(fields=['name'], name='unique_parameter'),
+        ]
 
     def __str__(self):
         return self.name
@@ -280,6 +297,70 @@ class ProductParameter(models.Model):
         ]
     
 
+class ProductFacet(models.Model):
+    """
+    Предрассчитанное количество позиций магазина в категории с данным значением параметра.
+    Пересчитывается импортом прайса (см. backend/facets.py) и используется
+    для счетчиков фасетного фильтра в каталоге вместо GROUP BY по ProductParameter.
+    """
+    objects = models.manager.Manager()
+    shop = models.ForeignKey(Shop, verbose_name=_('Магазин'), related_name='facets', on_delete=models.CASCADE)
+    category = models.ForeignKey(Category, verbose_name=_('Категория'), related_name='facets',
+                                 on_delete=models.CASCADE)
+    parameter = models.ForeignKey(Parameter, verbose_name=_('Параметр'), related_name='facets',
+                                  on_delete=models.CASCADE)
+    value = models.CharField(verbose_name=_('Значение'), max_length=100)
+    count = models.PositiveIntegerField(verbose_name=_('Количество позиций'))
+
+    class Meta:
+        verbose_name = _('Фасет')
+        verbose_name_plural = _('Список фасетов')
+        constraints = [
+            models.UniqueConstraint(fields=['shop', 'category', 'parameter', 'value'], name='unique_product_facet'),
+        ]
+        indexes = [
+            models.Index(fields=['category', 'parameter'], name='product_facet_category_idx'),
+        ] # счетчики каталога категории без фильтра по магазину
+
+
+class CatalogEntry(models.Model):
+    """
+    Плоская запись каталога (модель для чтения): одна строка на позицию ProductInfo
+    со всеми данными, которые отдает каталог, включая готовый список параметров.
+    Поддерживается импортом прайса в той же транзакции (см. backend/catalog.py),
+    поэтому чтение каталога не требует JOIN с Product, Category и prefetch параметров.
+    """
+    objects = models.manager.Manager()
+    product_info = models.OneToOneField(ProductInfo, verbose_name=_('Информация о продукте'), primary_key=True,
+                                        related_name='catalog_entry', on_delete=models.CASCADE)
+    shop = models.ForeignKey(Shop, verbose_name=_('Магазин'), related_name='catalog_entries',
+                             on_delete=models.CASCADE)
+    shop_name = models.CharField(max_length=50, verbose_name=_('Название магазина'))
+    category = models.ForeignKey(Category, verbose_name=_('Категория'), related_name='catalog_entries',
+                                 on_delete=models.CASCADE)
+    category_name = models.CharField(max_length=40, verbose_name=_('Название категории'))
+    product_name = models.CharField(max_length=80, verbose_name=_('Название продукта'))
+    model = models.CharField(max_length=80, verbose_name=_('Модель'), blank=True)
+    quantity = models.PositiveIntegerField(verbose_name=_('Количество'))
+    price = models.PositiveIntegerField(verbose_name=_('Цена'))
+    price_rrc = models.PositiveIntegerField(verbose_name=_('Рекомендуемая розничная цена'))
+    discount = models.IntegerField(verbose_name=_('Скидка от РРЦ'), default=0) # price_rrc - price, для сортировки
+    parameters = models.JSONField(verbose_name=_('Параметры'), default=list) # [{'parameter': ..., 'value': ...}]
+
+    class Meta:
+        verbose_name = _('Запись каталога')
+        verbose_name_plural = _('Каталог (модель для чтения)')
+        indexes = [
+            models.Index(fields=['shop', 'product_info'], name='catalog_entry_shop_idx'),
+            models.Index(fields=['category', 'product_info'], name='catalog_entry_category_idx'),
+            # курсорная пагинация каталога магазина или категории (сортировка по id позиции)
+            models.Index(fields=['price', 'product_info'], name='catalog_entry_price_idx'),
+            models.Index(fields=['shop', 'price', 'product_info'], name='catalog_entry_shop_price_idx'),
+            models.Index(fields=['category', 'price', 'product_info'], name='catalog_entry_cat_price_idx'),
+            models.Index(fields=['discount', 'product_info'], name='catalog_entry_discount_idx'),
+        ] # сортировка по цене и скидке (в обе стороны - обратным проходом по индексу)
+
+
 class Contact(models.Model):
     objects = models.manager.Manager()
     user = models.ForeignKey(User, verbose_name=_('Пользователь'),
@@ -324,6 +405,9 @@ class Order(models.Model):
     contact = models.ForeignKey(Contact, verbose_name=_('Контакт'),
                                 blank=True, null=True,
                                 on_delete=models.CASCADE)
+    # сумма позиций по их ценам (OrderItem.price); меняется вместе с позициями корзины
+    # и пересчитывается при оформлении заказа (см. backend/basket.py, backend/checkout.py)
+    total_sum = models.PositiveIntegerField(verbose_name=_('Сумма'), default=0)
 
     class Meta:
         verbose_name = _('Заказ')
@@ -351,6 +435,9 @@ class OrderItem(models.Model): # связывает заказ с конкрет
                                      blank=True,
                                      on_delete=models.CASCADE)
     quantity = models.PositiveIntegerField(verbose_name=_('Количество'))
+    # цена за единицу: в корзине - на момент добавления, после оформления заказа не меняется
+    # при обновлении прайса магазином
+    price = models.PositiveIntegerField(verbose_name=_('Цена'), default=0)
 
     class Meta:
         verbose_name = _('Заказанная позиция')
@@ -0,0 +1,55 @@
+"""
+Сравнение предложений: лучшее (самое дешевое) предложение по каждому продукту.
+
+Один продукт (название + категория) продается несколькими магазинами - по одной
+позиции ProductInfo в каждом. Лучшее предложение и число предложений продукта
+вычисляются в БД оконными функциями по разделу product_id (ROW_NUMBER по цене и
+COUNT): остаются только строки с номером 1, без группировки в Python. Раздел
+читается по индексу (product, price) позиций (см. ProductInfo.Meta.indexes).
+Учитываются только позиции в наличии у открытых магазинов.
+"""
+from django.db.models import Count, F, Q, QuerySet, Window
+from django.db.models.functions import RowNumber
+
+from backend.models import ProductInfo
+
+# поля лучшего предложения для values()
+OFFER_VALUES = ('product_id', 'product__name', 'product__category__name', 'id', 'model', 'shop_id', 'shop__name',
+                'quantity', 'price', 'price_rrc', 'offers')
+
+
+def best_offers(query: Q) -> QuerySet:
+    """
+    Лучшие предложения продуктов, позиции которых удовлетворяют условию query.
+
+    Args:
+        query (Q): условие на ProductInfo (категория, поиск), выбирающее продукты
+
+    Returns:
+        QuerySet: строки values(*OFFER_VALUES), по одной на продукт
+    """
+    products = ProductInfo.objects.filter(query).values('product_id')
+    offers = ProductInfo.objects.filter(product_id__in=products, shop__state=True, quantity__gt=0)
+    return offers.annotate(
+        rank=Window(RowNumber(), partition_by=F('product_id'), order_by=[F('price').asc(), F('id').asc()]),
+        offers=Window(Count('id'), partition_by=F('product_id')),
+    ).filter(rank=1).values(*OFFER_VALUES)
+
+
+def offer_data(row: dict) -> dict:
+    """
+    Вывод продукта с лучшим предложением из строки best_offers.
+    """
+    return {
+        'product': {'id': row['product_id'], 'name': row['product__name'], 'category': row['product__category__name']},
+        'offers': row['offers'], # количество предложений продукта (в наличии, у открытых магазинов)
+        'best_offer': {
+            'id': row['id'],
+            'model': row['model'],
+            'shop': row['shop_id'],
+            'shop_name': row['shop__name'],
+            'quantity': row['quantity'],
+            'price': row['price'],
+            'price_rrc': row['price_rrc'],
+        },
+    }
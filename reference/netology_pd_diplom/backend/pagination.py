@@ -0,0 +1,66 @@
+from typing import Callable
+
+from rest_framework.pagination import BasePagination, CursorPagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+
+class ProductInfoCursorPagination(CursorPagination):
+    """
+    Курсорная (keyset) пагинация каталога товаров.
+
+    Страница выбирается условием id > <последний id предыдущей страницы> по индексу,
+    а не через OFFSET, поэтому глубокие страницы отдаются так же быстро, как первая,
+    а вставка и удаление позиций во время листания не сдвигают страницы.
+    Ссылки next/previous сохраняют фильтры shop_id и category_id из запроса.
+    При сортировке по цене или скидке (ProductInfoView задает ordering из параметра запроса)
+    позицией курсора становится значение цены или скидки, а позиции с равными значениями
+    CursorPagination различает смещением внутри позиции.
+    """
+    ordering = 'pk' # id позиции (первичный ключ записи каталога): уникален, неизменен и проиндексирован
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+
+
+class SearchPagination(BasePagination):
+    """
+    Постраничный вывод результатов полнотекстового поиска (LIMIT/OFFSET по рангу).
+
+    Общее количество результатов не считается: запрашивается на одну запись больше
+    размера страницы, и по ней определяется, есть ли следующая страница.
+    """
+    page_size = api_settings.PAGE_SIZE
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+    def paginate_search(self, request, search: Callable[[int, int], list]) -> list:
+        """
+        Args:
+            request (Request): запрос с параметрами page и page_size
+            search (callable): поиск, принимающий limit и offset
+
+        Returns:
+            list: результаты текущей страницы
+        """
+        self.request = request
+        self.page = self._parameter('page', 1)
+        self.size = min(self._parameter(self.page_size_query_param, self.page_size), self.max_page_size)
+        results = search(self.size + 1, (self.page - 1) * self.size)
+        self.has_next = len(results) > self.size
+        return results[:self.size]
+
+    def _parameter(self, name: str, default: int) -> int:
+        try:
+            value = int(self.request.query_params.get(name, default))
+        except ValueError:
+            return default
+        return value if value > 0 else default
+
+    def get_paginated_response(self, data):
+        url = self.request.build_absolute_uri()
+        return Response({
+            'next': replace_query_param(url, 'page', self.page + 1) if self.has_next else None,
+            'previous': replace_query_param(url, 'page', self.page - 1) if self.page > 1 else None,
+            'results': data,
+        })
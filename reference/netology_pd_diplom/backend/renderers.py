@@ -0,0 +1,30 @@
+"""
+Рендерер JSON на ujson для ответов API.
+
+Вывод совпадает с rest_framework.renderers.JSONRenderer (компактные разделители,
+UTF-8 без экранирования), но кодирование выполняется на C. Типы, которых ujson не знает
+(даты, ленивые переводы, UUID и т.д.), преобразуются тем же JSONEncoder, что использует DRF.
+Ответы с отступами ('application/json; indent=4', браузер и отладка) отрисовывает
+сам JSONRenderer: расстановка переносов и пробелов у ujson отличается.
+"""
+from rest_framework import renderers
+from ujson import dumps as dump_json
+
+
+class UJSONRenderer(renderers.JSONRenderer):
+    """
+    JSONRenderer с кодированием через ujson.
+    """
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+
+        if self.get_indent(accepted_media_type, renderer_context or {}):
+            return super().render(data, accepted_media_type, renderer_context)
+
+        ret = dump_json(data, ensure_ascii=self.ensure_ascii, escape_forward_slashes=False,
+                        allow_nan=not self.strict, default=self.encoder_class().default)
+
+        # как в JSONRenderer: \u2028 и \u2029 экранируются, чтобы JSON оставался подмножеством javascript
+        ret = ret.replace('\u2028', '\\u2028').replace('\u2029', '\\u2029')
+        return ret.encode()
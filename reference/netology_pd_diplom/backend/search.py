@@ -0,0 +1,175 @@
+"""
+Полнотекстовый поиск по каталогу (название продукта и модель позиции).
+
+Индекс - отдельная таблица backend_productsearch, одна строка на ProductInfo:
+    SQLite - виртуальная таблица FTS5 (rowid = id ProductInfo), ранжирование bm25;
+    PostgreSQL - столбец tsvector с GIN-индексом, ранжирование ts_rank.
+Таблица создается после migrate (create_search_index подключен к post_migrate),
+а наполняется импортом прайсов (update_search_index для созданных и измененных позиций).
+Строки удаленных позиций удаляет сама БД: триггер в SQLite и внешний ключ с
+ON DELETE CASCADE в PostgreSQL. Заполнить индекс по существующему каталогу
+можно командой manage.py rebuild_search_index.
+На других СУБД поиск выполняется через icontains без индекса.
+"""
+import re
+from itertools import islice
+from typing import Iterable, Optional
+
+from django.db import connection
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+from backend.models import ProductInfo
+
+SEARCH_TABLE = 'backend_productsearch'
+SEARCH_CHUNK_SIZE = 500 # количество позиций в одном запросе обновления индекса
+
+_SQLITE_SCHEMA = (
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} USING fts5(name, model, tokenize = 'unicode61')",
+    f"CREATE TRIGGER IF NOT EXISTS {SEARCH_TABLE}_delete AFTER DELETE ON backend_productinfo "
+    f"BEGIN DELETE FROM {SEARCH_TABLE} WHERE rowid = old.id; END",
+)
+_POSTGRES_SCHEMA = (
+    f"CREATE TABLE IF NOT EXISTS {SEARCH_TABLE} ("
+    f"product_info_id bigint PRIMARY KEY REFERENCES backend_productinfo (id) ON DELETE CASCADE, "
+    f"document tsvector NOT NULL)",
+    f"CREATE INDEX IF NOT EXISTS {SEARCH_TABLE}_document ON {SEARCH_TABLE} USING gin (document)",
+)
+# название и модель разбиваются на слова по любым разделителям ('apple/iphone/xr' -> apple iphone xr)
+_POSTGRES_DOCUMENT = "to_tsvector('simple', regexp_replace(p.name || ' ' || pi.model, '\\W+', ' ', 'g'))"
+
+
+def create_search_index(**kwargs) -> None:
+    """
+    Создает таблицу индекса, если ее еще нет. Обработчик сигнала post_migrate.
+    """
+    schema = {'sqlite': _SQLITE_SCHEMA, 'postgresql': _POSTGRES_SCHEMA}.get(connection.vendor, ())
+    with connection.cursor() as cursor:
+        for statement in schema:
+            cursor.execute(statement)
+
+
+def update_search_index(product_info_ids: Iterable[int]) -> None:
+    """
+    Записывает в индекс текущие название и модель позиций (новых или изменившихся).
+
+    Args:
+        product_info_ids: id позиций ProductInfo
+    """
+    if connection.vendor not in ('sqlite', 'postgresql'):
+        return
+    iterator = iter(product_info_ids)
+    with connection.cursor() as cursor:
+        while chunk := list(islice(iterator, SEARCH_CHUNK_SIZE)):
+            placeholders = ', '.join(['%s'] * len(chunk))
+            if connection.vendor == 'sqlite':
+                cursor.execute(f'DELETE FROM {SEARCH_TABLE} WHERE rowid IN ({placeholders})', chunk)
+                cursor.execute(
+                    f'INSERT INTO {SEARCH_TABLE} (rowid, name, model) SELECT pi.id, p.name, pi.model '
+                    f'FROM backend_productinfo pi JOIN backend_product p ON p.id = pi.product_id '
+                    f'WHERE pi.id IN ({placeholders})', chunk)
+            else:
+                cursor.execute(
+                    f'INSERT INTO {SEARCH_TABLE} (product_info_id, document) SELECT pi.id, {_POSTGRES_DOCUMENT} '
+                    f'FROM backend_productinfo pi JOIN backend_product p ON p.id = pi.product_id '
+                    f'WHERE pi.id IN ({placeholders}) '
+                    f'ON CONFLICT (product_info_id) DO UPDATE SET document = EXCLUDED.document', chunk)
+
+
+def rebuild_search_index() -> int:
+    """
+    Перестраивает индекс по всему каталогу.
+
+    Returns:
+        int: количество проиндексированных позиций
+    """
+    create_search_index()
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {SEARCH_TABLE}')
+    ids = ProductInfo.objects.order_by('id').values_list('id', flat=True)
+    update_search_index(ids.iterator(chunk_size=SEARCH_CHUNK_SIZE))
+    return ids.count()
+
+
+def search_terms(query: str) -> list:
+    """
+    Слова поискового запроса в нижнем регистре (все остальные символы отбрасываются,
+    поэтому слова можно безопасно подставлять в синтаксис MATCH и to_tsquery).
+    """
+    return re.findall(r'\w+', query.lower())
+
+
+def _match(terms: list) -> str:
+    # запрос к индексу: все слова, каждое - как начало слова
+    if connection.vendor == 'sqlite':
+        return ' '.join(f'"{term}"*' for term in terms) # слова через пробел - все должны встретиться
+    return ' & '.join(f'{term}:*' for term in terms)
+
+
+def search_query(terms: list) -> Q:
+    """
+    Условие на ProductInfo: в названии или модели позиции есть все слова запроса
+    (без ранжирования - для фильтрации в других запросах каталога).
+
+    Args:
+        terms (list): слова запроса (search_terms)
+    """
+    if connection.vendor == 'sqlite':
+        return Q(id__in=RawSQL(f'SELECT rowid FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s', [_match(terms)]))
+    if connection.vendor == 'postgresql':
+        return Q(id__in=RawSQL(f"SELECT product_info_id FROM {SEARCH_TABLE} "
+                               f"WHERE document @@ to_tsquery('simple', %s)", [_match(terms)]))
+    query = Q()
+    for term in terms:
+        query &= Q(product__name__icontains=term) | Q(model__icontains=term)
+    return query
+
+
+def search_product_infos(terms: list, shop_id: Optional[str] = None, category_id: Optional[str] = None,
+                         limit: int = 20, offset: int = 0) -> list:
+    """
+    Ищет позиции открытых магазинов, в названии или модели которых есть все слова
+    запроса (каждое слово - как начало слова: '256' находит '256GB').
+
+    Args:
+        terms (list): слова запроса (search_terms)
+        shop_id (str): ограничить поиск магазином
+        category_id (str): ограничить поиск категорией
+        limit (int): количество результатов
+        offset (int): сколько результатов пропустить
+
+    Returns:
+        list: id позиций ProductInfo по убыванию релевантности
+    """
+    if connection.vendor not in ('sqlite', 'postgresql'):
+        queryset = ProductInfo.objects.filter(search_query(terms), shop__state=True)
+        if shop_id:
+            queryset = queryset.filter(shop_id=shop_id)
+        if category_id:
+            queryset = queryset.filter(product__category_id=category_id)
+        return list(queryset.order_by('id').values_list('id', flat=True)[offset:offset + limit])
+
+    filters, params = '', []
+    if shop_id:
+        filters += ' AND pi.shop_id = %s'
+        params.append(shop_id)
+    if category_id:
+        filters += ' AND p.category_id = %s'
+        params.append(category_id)
+
+    match = _match(terms)
+    if connection.vendor == 'sqlite':
+        sql = (f'SELECT pi.id FROM {SEARCH_TABLE} '
+               f'JOIN backend_productinfo pi ON pi.id = {SEARCH_TABLE}.rowid '
+               f'JOIN backend_product p ON p.id = pi.product_id JOIN backend_shop sh ON sh.id = pi.shop_id '
+               f'WHERE {SEARCH_TABLE} MATCH %s AND sh.state{filters} '
+               f'ORDER BY bm25({SEARCH_TABLE}), pi.id LIMIT %s OFFSET %s')
+    else:
+        sql = (f"SELECT pi.id FROM {SEARCH_TABLE} s, to_tsquery('simple', %s) q, backend_productinfo pi, "
+               f"backend_product p, backend_shop sh "
+               f"WHERE s.document @@ q AND pi.id = s.product_info_id AND p.id = pi.product_id "
+               f"AND sh.id = pi.shop_id AND sh.state{filters} "
+               f"ORDER BY ts_rank(s.document, q) DESC, pi.id LIMIT %s OFFSET %s")
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [match, *params, limit, offset])
+        return [row[0] for row in cursor.fetchall()]
@@ -1,7 +1,8 @@
 # Верстальщик
 from rest_framework import serializers
 
-from backend.models import User, Category, Shop, ProductInfo, Product, ProductParameter, OrderItem, Order, Contact
+from backend.models import User, Category, Shop, ProductInfo, Product, ProductParameter, OrderItem, Order, Contact, \
+    CatalogEntry
 
 
 class ContactSerializer(serializers.ModelSerializer):
@@ -62,11 +63,27 @@ class ProductInfoSerializer(serializers.ModelSerializer):
         read_only_fields = ('id',)
 
 
+class CatalogEntrySerializer(serializers.ModelSerializer):
+    # тот же формат, что у ProductInfoSerializer, но из плоской записи каталога без запросов к связанным моделям
+    id = serializers.IntegerField(source='product_info_id', read_only=True)
+    product = serializers.SerializerMethodField()
+    shop = serializers.IntegerField(source='shop_id', read_only=True)
+    product_parameters = serializers.JSONField(source='parameters', read_only=True)
+
+    class Meta:
+        model = CatalogEntry
+        fields = ('id', 'model', 'product', 'shop', 'quantity', 'price', 'price_rrc', 'product_parameters',)
+        read_only_fields = ('id',)
+
+    def get_product(self, entry: CatalogEntry) -> dict:
+        return {'name': entry.product_name, 'category': entry.category_name}
+
+
 class OrderItemSerializer(serializers.ModelSerializer):
     class Meta:
         model = OrderItem
-        fields = ('id', 'product_info', 'quantity', 'order',)
-        read_only_fields = ('id',)
+        fields = ('id', 'product_info', 'quantity', 'price', 'order',)
+        read_only_fields = ('id', 'price',) # цена позиции: при добавлении в корзину, зафиксирована при оформлении
         extra_kwargs = {
             'order': {'write_only': True}
         }
@@ -2,11 +2,12 @@ from typing import Type
 
 from django.conf import settings
 from django.core.mail import EmailMultiAlternatives
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver, Signal
 from django_rest_passwordreset.signals import reset_password_token_created
 
-from backend.models import ConfirmEmailToken, User, Order
+from backend.cache import bump_catalog_version, bump_order_version
+from backend.models import ConfirmEmailToken, User, Order, Contact, Shop, Category, CatalogEntry
 
 # Сигналы для отслеживания событий, таких как создание нового 
 # пользователя и сброс пароля. Каждый раз, когда происходит событие, соответствующий 
@@ -16,6 +17,8 @@ new_user_registered = Signal() # сигнал для регистрации но
 
 new_order = Signal() # сигнал для обновления статуса заказа
 
+catalog_changed = Signal() # сигнал об изменении каталога (импорт прайса, открытие/закрытие магазина)
+
 @receiver(reset_password_token_created)
 def password_reset_token_created(sender: Type[User], instance: User, reset_password_token: ConfirmEmailToken, **kwargs) -> None:
     """
@@ -129,4 +132,52 @@ def new_order_signal(user_id: int, order: Order, **kwargs) -> None:
     except Exception as e:
         print(f"Error sending email: {str(e)}")
 
-######################### NEW NEW NEW ########################
\ No newline at end of file
+######################### NEW NEW NEW ########################
+
+
+@receiver(catalog_changed)
+def catalog_changed_signal(sender, shop_id: int = None, **kwargs) -> None:
+    """
+    Увеличивает версию каталога, чтобы закешированные ответы каталога устарели.
+
+    Args:
+        sender: отправитель сигнала
+        shop_id (int): id магазина, каталог которого изменился
+        **kwargs: дополнительные параметры
+    """
+    bump_catalog_version(shop_id)
+
+
+@receiver(post_save, sender=Shop)
+@receiver(post_save, sender=Category)
+def catalog_model_saved_signal(sender, instance, **kwargs) -> None:
+    """
+    Изменение магазина или категории (например, через админку) тоже меняет каталог:
+    обновляем названия в модели каталога для чтения и версию каталога. Категория есть
+    в каталоге всех магазинов с ее товарами, поэтому меняются и версии этих магазинов.
+    """
+    if sender is Shop:
+        CatalogEntry.objects.filter(shop_id=instance.id).update(shop_name=instance.name)
+        bump_catalog_version(instance.id)
+        return
+    entries = CatalogEntry.objects.filter(category_id=instance.id)
+    entries.update(category_name=instance.name)
+    shop_ids = set(entries.values_list('shop_id', flat=True).distinct())
+    for shop_id in shop_ids:
+        bump_catalog_version(shop_id)
+    if not shop_ids:
+        bump_catalog_version()
+
+
+@receiver(post_save, sender=Order)
+@receiver(post_delete, sender=Order)
+@receiver(post_save, sender=Contact)
+@receiver(post_delete, sender=Contact)
+def order_saved_signal(sender, instance, **kwargs) -> None:
+    """
+    Изменение заказа или контакта (контакт выводится в заказе) меняет версию заказов пользователя,
+    чтобы ETag ответа order устарел. Позиции заказов в API меняются только в корзине,
+    которой нет в списке заказов; изменение позиций в админке учитывает OrderItemAdmin.
+    """
+    bump_order_version(instance.user_id)
+
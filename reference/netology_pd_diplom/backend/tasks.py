@@ -1,7 +1,11 @@
 from celery import shared_task
 from django.conf import settings
 from django.core.mail import EmailMultiAlternatives
-from backend.models import ConfirmEmailToken, User, Order
+from django.db import transaction
+from backend.basket_store import flush_dirty_baskets
+from backend.feed import fetch_price_list, PriceListReader
+from backend.importer import ImportStats, PriceListImporter
+from backend.models import ConfirmEmailToken, User, Order, Shop
 
 
 @shared_task
@@ -69,3 +73,67 @@ def send_order_status_update_email(user_email: str, order_id: int, state_display
         [user_email],
     )
     msg.send()
+
+
+@shared_task(bind=True)
+def import_price_list(self, user_id: int, url: str, force: bool = False, dry_run: bool = False) -> dict:
+    """
+    Асинхронная задача импорта прайс-листа магазина.
+
+    Пока задача выполняется, после каждого пакета товаров в состояние PROGRESS
+    записывается статистика импорта, которую отдает эндпоинт partner/update/<task_id>.
+    Прайс, не изменившийся с прошлого импорта (ответ 304 или тот же хеш содержимого),
+    не разбирается и не записывается.
+    В режиме dry_run каталог не меняется, а в результат добавляется план изменений (plan).
+
+    Args:
+        user_id (int): ID пользователя (магазина), загрузившего прайс.
+        url (str): Адрес yaml-файла прайса.
+        force (bool): Импортировать прайс, даже если он не изменился.
+        dry_run (bool): Только сравнить прайс с каталогом, ничего не записывая.
+
+    Returns:
+        dict: итоговая статистика импорта.
+    """
+    def progress(stats: ImportStats) -> None:
+        self.update_state(state='PROGRESS', meta=stats.as_dict())
+
+    progress(ImportStats())
+    shop = Shop.objects.filter(user_id=user_id).first()
+    conditional = shop is not None and shop.url == url and not force
+    download = fetch_price_list(url, etag=shop.feed_etag if conditional else '',
+                                last_modified=shop.feed_last_modified if conditional else '')
+    if download is None:
+        return {'shop': shop and shop.id, **ImportStats(not_modified=True, dry_run=dry_run).as_dict()}
+
+    with download.file: # временный файл прайса удаляется при любом исходе импорта
+        if shop is not None and not force and shop.feed_digest == download.digest:
+            return {'shop': shop.id, **ImportStats(not_modified=True, dry_run=dry_run).as_dict()}
+
+        reader = PriceListReader(download.file)
+        if dry_run:
+            shop = (Shop.objects.filter(name=reader.shop, user_id=user_id).first()
+                    or Shop(name=reader.shop, user_id=user_id))
+            importer = PriceListImporter(shop, progress=progress, dry_run=True)
+            stats = importer.run(reader.categories, reader.goods())
+            return {'shop': shop.id, **stats.as_dict(), 'plan': importer.plan.as_dict()}
+
+        shop, _ = Shop.objects.get_or_create(name=reader.shop, user_id=user_id)
+        with transaction.atomic():
+            stats = PriceListImporter(shop, progress=progress).run(reader.categories, reader.goods())
+            # запоминаем версию прайса только после успешного импорта
+            Shop.objects.filter(id=shop.id).update(url=url, feed_etag=download.etag,
+                                                   feed_last_modified=download.last_modified,
+                                                   feed_digest=download.digest)
+    return {'shop': shop.id, **stats.as_dict()}
+
+
+@shared_task
+def flush_baskets() -> int:
+    """
+    Периодическая задача записи корзин из кеша в БД (BASKET_STORE = 'cache', см. backend/basket_store.py).
+
+    Returns:
+        int: количество записанных корзин.
+    """
+    return flush_dirty_baskets()
@@ -3,11 +3,14 @@ from django_rest_passwordreset.views import reset_password_request_token, reset_
 
 from backend.views import PartnerUpdate, RegisterAccount, LoginAccount, CategoryView, ShopView, ProductInfoView, \
     BasketView, \
-    AccountDetails, ContactView, OrderView, PartnerState, PartnerOrders, ConfirmAccount
+    AccountDetails, ContactView, OrderView, PartnerState, PartnerOrders, ConfirmAccount, PartnerUpdateStatus, \
+    PartnerExport, ProductSearchView, ProductOffersView
 
 app_name = 'backend'
 urlpatterns = [
     path('partner/update', PartnerUpdate.as_view(), name='partner-update'),
+    path('partner/update/<str:task_id>', PartnerUpdateStatus.as_view(), name='partner-update-status'),
+    path('partner/export', PartnerExport.as_view(), name='partner-export'),
     path('partner/state', PartnerState.as_view(), name='partner-state'),
     path('partner/orders', PartnerOrders.as_view(), name='partner-orders'),
     path('user/register', RegisterAccount.as_view(), name='user-register'),
@@ -21,7 +24,9 @@ urlpatterns = [
                                                                                     # путем отправки токена сброса пароля
     path('categories', CategoryView.as_view(), name='categories'),
     path('shops', ShopView.as_view(), name='shops'),
-    path('products', ProductInfoView.as_view(), name='shops'),
+    path('products', ProductInfoView.as_view(), name='products'),
+    path('products/search', ProductSearchView.as_view(), name='products-search'),
+    path('products/offers', ProductOffersView.as_view(), name='products-offers'),
     path('basket', BasketView.as_view(), name='basket'),
     path('order', OrderView.as_view(), name='order'),
 
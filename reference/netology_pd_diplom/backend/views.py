@@ -6,22 +6,49 @@ from django.contrib.auth.password_validation import validate_password
 from django.core.exceptions import ValidationError
 from django.core.validators import URLValidator
 from django.db import IntegrityError
-from django.db.models import Q, Sum, F
-from django.http import JsonResponse
-from requests import get
+from django.db.models import Q
+from django.http import JsonResponse, StreamingHttpResponse
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import condition
 from rest_framework.authtoken.models import Token
 from rest_framework.generics import ListAPIView
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from ujson import loads as load_json # более быстрая альтернатива стандартной библиотеки json
-from yaml import load as load_yaml, Loader
 from rest_framework import status # статусы ошибок
 
-from backend.models import Shop, Category, Product, ProductInfo, Parameter, ProductParameter, Order, OrderItem, \
-    Contact, ConfirmEmailToken
-from backend.serializers import UserSerializer, CategorySerializer, ShopSerializer, ProductInfoSerializer, \
-    OrderItemSerializer, OrderSerializer, ContactSerializer
-from backend.signals import new_user_registered, new_order
+from backend.models import Shop, Category, Order, OrderItem, Contact, ConfirmEmailToken, CatalogEntry
+from backend.serializers import UserSerializer, CategorySerializer, ShopSerializer, ContactSerializer
+from backend.signals import new_order, catalog_changed
+from backend.cache import CachedCatalogMixin, cached_response, catalog_etag, order_etag
+from backend import basket_store
+from backend.basket import add_basket_items, delete_basket_items, update_basket_items
+from backend.basket_store import BasketBusy, basket_store_enabled, flush_basket
+from backend.catalog import catalog_filter_query, catalog_ordering
+from backend.checkout import place_order
+from backend.export import EXPORT_FORMATS
+from backend.fast_serializers import CATALOG_ENTRY_FIELDS, CATALOG_EXPANSIONS, ORDER_EXPANSIONS, ORDER_FIELDS, \
+    catalog_entries_data, catalog_entry_values, orders_data, parse_fieldset, prepare_orders
+from backend.facets import facet_counts, parameter_query, parse_parameter_filters
+from backend.pagination import ProductInfoCursorPagination, SearchPagination
+from backend.offers import best_offers, offer_data
+from backend.search import search_product_infos, search_query, search_terms
+from backend.tasks import import_price_list
+from netology_pd_diplom.celery import get_result
+
+
+def order_fieldsets(request: Request) -> tuple:
+    """
+    Параметры fields и expand запроса списка заказов.
+
+    Returns:
+        tuple: выбранные поля и раскрытия (None - параметр не указан, выводится все)
+
+    Raises:
+        ValueError: если указаны неизвестные поля
+    """
+    return (parse_fieldset(request.query_params.get('fields') or None, ORDER_FIELDS),
+            parse_fieldset(request.query_params.get('expand'), ORDER_EXPANSIONS))
 
 
 # class RegisterAccount(APIView):
@@ -245,7 +272,7 @@ class LoginAccount(APIView):
         return JsonResponse({'Status': False, 'Errors': 'Не указаны все необходимые аргументы'}, status=400) # если не указаны все необходимые аргументы
 
 
-class CategoryView(ListAPIView): 
+class CategoryView(CachedCatalogMixin, ListAPIView): 
     """
     Класс для просмотра списка категорий товаров
     """
@@ -253,7 +280,7 @@ class CategoryView(ListAPIView):
     serializer_class = CategorySerializer # сериализуем их 
 
 
-class ShopView(ListAPIView):
+class ShopView(CachedCatalogMixin, ListAPIView):
     """
     Класс для просмотра списка магазинов
     """
@@ -269,9 +296,11 @@ class ProductInfoView(APIView):
     - get: Retrieve the product information based on the specified filters.
 
     Attributes:
-    - None
+    - pagination_class: курсорная пагинация по id или по выбранной сортировке (ordering)
     """
+    pagination_class = ProductInfoCursorPagination
 
+    @method_decorator(condition(etag_func=catalog_etag)) # 304 по версии каталога без запросов к БД
     def get(self, request: Request, *args, **kwargs):
         """
         Клас для поиска продуктов по фильтрам.
@@ -291,32 +320,131 @@ class ProductInfoView(APIView):
             query = query & Q(shop_id=shop_id) # фильтруем продукты по id магазина
 
         if category_id: # если id категории указан
-            query = query & Q(product__category_id=category_id) # фильтруем продукты по id категории
+            query = query & Q(category_id=category_id) # фильтруем продукты по id категории
+
+        try: # фильтры по параметрам: parameter=Цвет:черный&parameter=Цвет:белый&parameter=Встроенная память (Гб):256
+            parameter_filters = parse_parameter_filters(request.query_params.getlist('parameter'))
+            # выводимые поля и раскрытия: fields=id,price,quantity&expand= - без параметров товаров и фасетов
+            fields = parse_fieldset(request.query_params.get('fields') or None, CATALOG_ENTRY_FIELDS)
+            expand = parse_fieldset(request.query_params.get('expand'), CATALOG_EXPANSIONS)
+            # диапазон цен, наличие и сортировка: price_min=1000&price_max=50000&in_stock=true&ordering=-discount
+            catalog_filters = catalog_filter_query(request.query_params)
+            ordering = catalog_ordering(request.query_params.get('ordering'))
+        except ValueError as error:
+            return JsonResponse({'Status': False, 'Errors': str(error)}, status=400)
+        query = query & catalog_filters & parameter_query(parameter_filters)
+
+        # каталог читается из плоской модели CatalogEntry (одна строка на позицию, параметры уже в JSON),
+        # поэтому не нужны JOIN с продуктом и категорией и prefetch параметров;
+        # JOIN остается только с магазином - для фильтра по статусу
+        queryset = CatalogEntry.objects.filter(query)
+
+        def build():
+            paginator = self.pagination_class()
+            paginator.ordering = ordering # сортировка по индексам каталога (см. CatalogEntry.Meta.indexes)
+            # строки values() только с нужными столбцами: вывод как у CatalogEntrySerializer (см. backend/fast_serializers.py);
+            # столбец сортировки нужен курсору для позиции страницы, даже если не выводится
+            columns = catalog_entry_values(fields)
+            position = ordering[0].lstrip('-')
+            if position not in columns:
+                columns += (position,)
+            page = paginator.paginate_queryset(queryset.values(*columns), request, view=self)
+            response = paginator.get_paginated_response(catalog_entries_data(page, fields))
+            if expand is None or 'facets' in expand:
+                response.data['facets'] = facet_counts(shop_id, category_id, catalog_filters) # счетчики с теми же фильтрами цены и наличия
+            return response
+
+        # ответ кешируется до следующего изменения каталога (магазина shop_id или всего каталога)
+        return cached_response(request, build, shop_id=shop_id)
+
+
+class ProductSearchView(APIView):
+    """
+    Класс для полнотекстового поиска продуктов.
+
+    Methods:
+    - get: Search the product information by product name and model.
 
-        # фильтруем объекты ProductInfo по сформированному запросу query и отбрасываем дубликаты
-        queryset = ProductInfo.objects.filter(
-            query).select_related( # информация о связанных магазинах (shop) и категориях продуктов (product__category) 
-                                # будет загружена джоином с основным объектом ProductInfo (т.е. в одном запросе к БД что эффективно)
-            'shop', 'product__category').prefetch_related( # В отличие от select_related, метод выполняет отдельные запросы для получения связанных объектов, 
-                                                # а затем соединяет их в Python с объектом ProductInfo. 
-                                                # Здесь он извлекает параметры каждого продукта и их значения и соединяет с информацией о продукте.
-            'product_parameters__parameter').distinct() # удаления дублирующихся записей из результата выборки
+    Attributes:
+    - pagination_class: постраничный вывод по релевантности
+    """
+    pagination_class = SearchPagination
 
-        # ПОМЕТКА! prefetch_related - выполняет отдельные запросы для основной модели и для связанных объектов. Затем результаты объединяются в Python.
-        # ПОМЕТКА! select_related - использует SQL JOIN для выполнения запроса и получения связанных объектов одновременно с основным объектом.
+    @method_decorator(condition(etag_func=catalog_etag))
+    def get(self, request: Request, *args, **kwargs):
+        """
+        Найти продукты по словам из названия продукта и модели (параметр q),
+        например "iphone xr 256". Результаты отсортированы по релевантности,
+        поиск можно ограничить параметрами shop_id и category_id.
 
-        # ЗАМЕТКА
-        # Жадная загрузка (чтобы уменьшить количество обращений к базе данных)
-        # всех связей из поля 'shop' (это id магазинов модели Shop) и из поля 'product' -
-        # это id продуктов соответствующей категории (поле 'category' модели Product, 
-        # содержит id категорий, связанной модели Category). 
+        Args:
+        - request (Request): The Django request object.
 
-        # поле 'product_parameters' содержит id, связывающие значения параметров продуктов, 
-        # с ProductInfo, а поле 'parameter' содержит id названий этих параметров из модели Parametr.
+        Returns:
+        - Response: The response containing the found product information.
+        """
+        terms = search_terms(request.query_params.get('q', ''))
+        if not terms:
+            return JsonResponse({'Status': False, 'Errors': 'Не указан поисковый запрос'}, status=400)
+        shop_id = request.query_params.get('shop_id')
+        category_id = request.query_params.get('category_id')
+        try:
+            fields = parse_fieldset(request.query_params.get('fields') or None, CATALOG_ENTRY_FIELDS)
+        except ValueError as error:
+            return JsonResponse({'Status': False, 'Errors': str(error)}, status=400)
 
-        serializer = ProductInfoSerializer(queryset, many=True)
+        def build():
+            paginator = self.pagination_class()
+            ids = paginator.paginate_search(request, lambda limit, offset: search_product_infos(
+                terms, shop_id=shop_id, category_id=category_id, limit=limit, offset=offset))
+            rows = {row['pk']: row for row in CatalogEntry.objects.filter(pk__in=ids).values(*catalog_entry_values(fields))}
+            return paginator.get_paginated_response(catalog_entries_data([rows[pk] for pk in ids if pk in rows], fields))
 
-        return Response(serializer.data)
+        return cached_response(request, build, shop_id=shop_id)
+
+
+class ProductOffersView(APIView):
+    """
+    Класс для сравнения предложений магазинов.
+
+    Methods:
+    - get: Retrieve the cheapest in-stock offer and the number of offers for each product.
+
+    Attributes:
+    - pagination_class: курсорная пагинация по id продукта
+    """
+    pagination_class = ProductInfoCursorPagination
+
+    @method_decorator(condition(etag_func=catalog_etag))
+    def get(self, request: Request, *args, **kwargs):
+        """
+        Получить по каждому продукту категории (category_id) или найденному
+        по словам запроса (q) самое дешевое предложение в наличии и количество предложений.
+
+        Args:
+        - request (Request): The Django request object.
+
+        Returns:
+        - Response: The response containing the best offers.
+        """
+        category_id = request.query_params.get('category_id')
+        terms = search_terms(request.query_params.get('q', ''))
+        if not category_id and not terms:
+            return JsonResponse({'Status': False, 'Errors': 'Не указаны category_id или поисковый запрос q'},
+                                status=400)
+        query = Q()
+        if category_id:
+            query &= Q(product__category_id=category_id)
+        if terms:
+            query &= search_query(terms)
+
+        def build():
+            paginator = self.pagination_class()
+            paginator.ordering = 'product_id' # у каждого продукта одно лучшее предложение
+            page = paginator.paginate_queryset(best_offers(query), request, view=self)
+            return paginator.get_paginated_response([offer_data(row) for row in page])
+
+        return cached_response(request, build)
 
 
 class BasketView(APIView):
@@ -333,6 +461,12 @@ class BasketView(APIView):
     - None
     """
 
+    def handle_exception(self, exc):
+        # корзина в кеше заблокирована другим запросом дольше LOCK_TIMEOUT (см. backend/basket_store.py)
+        if isinstance(exc, BasketBusy):
+            return JsonResponse({'Status': False, 'Errors': str(exc)}, status=status.HTTP_409_CONFLICT)
+        return super().handle_exception(exc)
+
     # получить корзину
     def get(self, request, *args, **kwargs):
         """
@@ -347,16 +481,18 @@ class BasketView(APIView):
         if not request.user.is_authenticated: # проверяется, аутентифицирован ли пользователь
             return JsonResponse({'Status': False, 'Error': 'Log in required'}, status=403)
         
-        # Извлекаем заказы из корзины и рассчитываем итоговую стоимость заказов в корзине
-        basket = Order.objects.filter( # Из модели Order извлекаются заказы пользователя с заданным user_id, у которых состояние равно "basket" (корзина)
-            user_id=request.user.id, state='basket').prefetch_related( # заранее извлекаем связанные данные, 
-                                            # что минимизирует количество запросов к базе данных и улучшает производительность
-            'ordered_items__product_info__product__category', # у id покупателя заказ, количество заказанных товаров их характеристики, названия и категории.
-            'ordered_items__product_info__product_parameters__parameter').annotate( # параметры товаров и их значения.
-            total_sum=Sum(F('ordered_items__quantity') * F('ordered_items__product_info__price'))).distinct()
-            # далее рассчитываем итоговую стоимость заказа total_sum - умножаем количество заказанных товаров на их цену и суммируем общую цену
-        serializer = OrderSerializer(basket, many=True) # сериализуем все заказы в корзине в формат JSON 
-        return Response(serializer.data)
+        try: # выводимые поля и раскрытия (fields=id,total_sum - без позиций и параметров товаров)
+            fields, expand = order_fieldsets(request)
+        except ValueError as error:
+            return JsonResponse({'Status': False, 'Errors': str(error)}, status=400)
+
+        if basket_store_enabled(): # корзина хранится в кеше: незаписанные изменения записываются в БД
+            flush_basket(request.user.id)
+        # Извлекаем заказы из корзины; связанные данные (позиции, товары, параметры) добавляются в запрос
+        # только для выбранных полей (см. prepare_orders), итоговая стоимость total_sum хранится в заказе
+        basket = prepare_orders(Order.objects.filter(user_id=request.user.id, state='basket'), fields, expand)
+        # вывод как у OrderSerializer(basket, many=True), но без полей DRF на каждый объект (см. backend/fast_serializers.py)
+        return Response(orders_data(basket, fields, expand))
 
     # редактировать корзину
     def post(self, request, *args, **kwargs):
@@ -380,6 +516,14 @@ class BasketView(APIView):
             except ValueError:
                 return JsonResponse({'Status': False, 'Errors': 'Неверный формат запроса'})
             else: # если JSON-строка при преобразовании в словарь python была валидна
+                if not isinstance(items_dict, list):
+                    return JsonResponse({'Status': False, 'Errors': 'Неверный формат запроса'})
+                if basket_store_enabled(): # корзина в кеше: в БД только читаются остатки (см. backend/basket_store.py)
+                    objects_created, objects_updated, errors = basket_store.add_items(request.user.id, items_dict)
+                    if errors:
+                        return JsonResponse({'Status': False, 'Errors': errors})
+                    return JsonResponse({'Status': True, 'Создано объектов': objects_created,
+                                         'Обновлено объектов': objects_updated})
                 # добавляем товары в корзину: в моделе Order создаем новый заказ для пользователя с id
                 # и присваеваем ему статус "корзина"
                 basket, _ = Order.objects.get_or_create(user_id=request.user.id, state='basket') # создаем корзину, как экземпляр модели Order 
@@ -391,23 +535,13 @@ class BasketView(APIView):
                 # Этот параметр не используется в дальнейшем коде, так как он обозначен знаком подчеркивания (зачастую 
                 # это означает, что значение не нужно).
                 
-                objects_created = 0 # счетчик добавленных в корзину товаров  
-                for order_item in items_dict: # для каждого товара из словаря items_dict ...
-                    order_item.update({'order': basket.id}) # ... добавляем id заказа (в словарь order_item добавляем/обновляем ключ order со значением basket.id) 
-                    serializer = OrderItemSerializer(data=order_item) # создаем экземпляр сериализатора OrderItemSerializer с данными из order_item
-                    if serializer.is_valid(): # если данные валидны
-                        try:
-                            serializer.save() # сохраняем данные в модели OrderItem 
-                        except IntegrityError as error:
-                            return JsonResponse({'Status': False, 'Errors': str(error)})
-                        else:
-                            objects_created += 1 # увеличиваем счетчик
-
-                    else:
-
-                        return JsonResponse({'Status': False, 'Errors': serializer.errors})
-
-                return JsonResponse({'Status': True, 'Создано объектов': objects_created})
+                # все строки проверяются одним запросом и записываются одним INSERT ... ON CONFLICT:
+                # при ошибке в любой строке корзина не меняется (см. backend/basket.py)
+                objects_created, objects_updated, errors = add_basket_items(basket, items_dict)
+                if errors:
+                    return JsonResponse({'Status': False, 'Errors': errors})
+                return JsonResponse({'Status': True, 'Создано объектов': objects_created,
+                                     'Обновлено объектов': objects_updated})
         return JsonResponse({'Status': False, 'Errors': 'Не указаны все необходимые аргументы'})
 
     # удалить товары из корзины
@@ -427,32 +561,15 @@ class BasketView(APIView):
         items_sting = request.data.get('items') # из байт-строки в формате JSON получаем данные о товарах из запроса
         if items_sting: # если данные о товарах указаны в запросе
             items_list = items_sting.split(',') # сплитуем строку по разделителю "," получая на выходе список id товаров для удаления
-            # Получаем корзину пользователя
-            basket, _ = Order.objects.get_or_create(user_id=request.user.id, state='basket') 
-            query = Q() # создаем пустое условие фильтрации.
-            objects_deleted = False # Флаг для отслеживания, были ли удалены товары.
-            for order_item_id in items_list: # для каждого id товара в списке
-                if order_item_id.isdigit(): # Проверяем, является ли идентификатор числом.
-                    # Добавляем условие для удаления в запрос Q ... 
-                    query = query | Q(order_id=basket.id, id=order_item_id) # которое используется для фильтрации модели 
-                                            # OrderItem по идентификатору заказа и идентификатору товара ниже.
-                    # СПРАВКА
-                    # Если в переменной items_list находятся значения [3, 5], и id корзины basket.id = 1, 
-                    # запрос query будет последовательно строиться так:
-                    # После первого элемента: Q(order_id=1, id=3)
-                    # После второго элемента: Q(order_id=1, id=3) | Q(order_id=1, id=5)
-                    # Таким образом, в результате вы получите один объект Q, 
-                    # который соответствует всем указанным идентификаторам в корзине. 
-
-                    objects_deleted = True # Устанавливаем флаг, что у нас есть объекты для удаления.
-
-            if objects_deleted: # Если есть объекты для удаления, выполняем удаление.
-                deleted_count = OrderItem.objects.filter(query).delete()[0] # Удаляем объекты, соответствующие условию в query из OrderItem.
-                # СПРАВКА
-                # Метод delete() возвращает кортеж (количество удаленных записей, словарь, где ключами являются модели, а значениями — количество удаленных записей для каждой модели)
-                # мы используем [0], чтобы извлечь только первый элемент (количество удаленных объектов) из возвращаемого кортежа
-                # для формирования ответа пользователю
-                
+            item_ids = [int(order_item_id) for order_item_id in items_list if order_item_id.isdigit()] # id позиций корзины
+            if item_ids and basket_store_enabled(): # корзина в кеше
+                return JsonResponse({'Status': True, 'Удалено объектов': basket_store.delete_items(request.user.id,
+                                                                                                  item_ids)})
+            if item_ids: # Если есть объекты для удаления, выполняем удаление.
+                # Получаем корзину пользователя
+                basket, _ = Order.objects.get_or_create(user_id=request.user.id, state='basket')
+                # удаляем позиции этой корзины одним DELETE и уменьшаем сумму корзины на их стоимость
+                deleted_count = delete_basket_items(basket, item_ids)
                 return JsonResponse({'Status': True, 'Удалено объектов': deleted_count})
         return JsonResponse({'Status': False, 'Errors': 'Не указаны все необходимые аргументы'})
 
@@ -477,14 +594,19 @@ class BasketView(APIView):
             except ValueError:
                 return JsonResponse({'Status': False, 'Errors': 'Неверный формат запроса'})
             else:
+                if not isinstance(items_dict, list):
+                    return JsonResponse({'Status': False, 'Errors': 'Неверный формат запроса'})
+                if basket_store_enabled(): # корзина в кеше
+                    objects_updated, objects_deleted, results = basket_store.update_items(request.user.id, items_dict)
+                    return JsonResponse({'Status': True, 'Обновлено объектов': objects_updated,
+                                         'Удалено объектов': objects_deleted, 'Результаты': results})
                 basket, _ = Order.objects.get_or_create(user_id=request.user.id, state='basket') # Получаем заказ пользователя
-                objects_updated = 0 # счетчик обновленных объектов
-                for order_item in items_dict: # для каждого товара в запросе
-                    if type(order_item['id']) == int and type(order_item['quantity']) == int: # проверяем, что идентификатор и количество являются целыми числами
-                        objects_updated += OrderItem.objects.filter(order_id=basket.id, id=order_item['id']).update(
-                            quantity=order_item['quantity']) # обновляем количество товара 
+                # все изменения - одним UPDATE с CASE, позиции с количеством 0 удаляются одним DELETE
+                # в той же транзакции; по каждой строке возвращается результат (см. backend/basket.py)
+                objects_updated, objects_deleted, results = update_basket_items(basket, items_dict)
 
-                return JsonResponse({'Status': True, 'Обновлено объектов': objects_updated})
+                return JsonResponse({'Status': True, 'Обновлено объектов': objects_updated,
+                                     'Удалено объектов': objects_deleted, 'Результаты': results})
         return JsonResponse({'Status': False, 'Errors': 'Не указаны все необходимые аргументы'})
 
 
@@ -523,45 +645,102 @@ class PartnerUpdate(APIView):
             except ValidationError as e:
                 return JsonResponse({'Status': False, 'Error': str(e)}, status=400) # возвращаем ошибку 400 и сообщение об ошибке валидации url
             else:
-                stream = get(url).content # получаем контент из yaml-файла размещенного по некоторому url 
+                # прайс скачивается и синхронизируется с каталогом в фоне задачей Celery (см. backend/tasks.py),
+                # клиент сразу получает id задачи и следит за ходом импорта через partner/update/<task_id>
+                try:
+                    force = bool(strtobool(str(request.data.get('force', 'false')))) # импортировать даже неизменившийся прайс
+                    dry_run = bool(strtobool(str(request.data.get('dry_run', 'false')))) # только план изменений, без записи
+                except ValueError as e:
+                    return JsonResponse({'Status': False, 'Error': str(e)}, status=400)
+                task = import_price_list.delay(user_id=request.user.id, url=url, force=force, dry_run=dry_run)
+                return JsonResponse({'Status': True, 'Task': task.id}, status=200)
 
-                data = load_yaml(stream, Loader=Loader) # декодируем контент и преобразуем в словарь 
+        return JsonResponse({'Status': False, 'Errors': 'Не указаны все необходимые аргументы'}, status=400) # возвращаем ошибку 400 и сообщение о необходимости указать все необходимые аргументы
 
-                shop, _ = Shop.objects.get_or_create(name=data['shop'], user_id=request.user.id) # получаем или создаем магазин с названием из data['shop'] и авторизированным пользователем request.user.id
-                
-                # ЗАМЕТКА:
-                # request:
-                # Это объект HttpRequest, который передается в представление в Django. Он содержит всю информацию о текущем запросе, включая данные о пользователе, 
-                # пришедшие из HTTP-заголовков, параметры URL, данные и тд
-                # request.user:
-                # Это атрибут объекта request, который возвращает объект пользователя (класса User) для текущего запроса (если пользователь аутенифицирован is_authenticated = True).
-                # request.user.id:
-                # Это доступ к атрибуту id объекта пользователя. Он возвращает уникальный идентификатор пользователя в базе данных. 
-
-                for category in data['categories']: # проходим по категориям в data['categories']
-                    category_object, _ = Category.objects.get_or_create(id=category['id'], name=category['name']) # получаем или создаем категорию с id и name из category
-                    category_object.shops.add(shop.id) # добавляем магазин в категорию
-                    category_object.save() # сохраняем изменения в категории 
-                ProductInfo.objects.filter(shop_id=shop.id).delete() # удаляем из прайса все загруженные в магазин shop.id товары 
-                for item in data['goods']: # проходим по товарам в data['goods']
-                    product, _ = Product.objects.get_or_create(name=item['name'], category_id=item['category']) # получаем или создаем продукт с названием item['name'] и категорией item['category']
-
-                    product_info = ProductInfo.objects.create(product_id=product.id,
-                                                              external_id=item['id'],
-                                                              model=item['model'],
-                                                              price=item['price'],
-                                                              price_rrc=item['price_rrc'],
-                                                              quantity=item['quantity'],
-                                                              shop_id=shop.id) # создаем информацию о продукте
-                    for name, value in item['parameters'].items(): # проходим по ключам и значениям в item['parameters']
-                        parameter_object, _ = Parameter.objects.get_or_create(name=name) # получаем или создаем параметр товара с названием name
-                        ProductParameter.objects.create(product_info_id=product_info.id,
-                                                        parameter_id=parameter_object.id,
-                                                        value=value) # создаем значение параметра товара
-
-                return JsonResponse({'Status': True}, status=200) # возвращаем сообщение об успешном обновлении прайса 
 
-        return JsonResponse({'Status': False, 'Errors': 'Не указаны все необходимые аргументы'}, status=400) # возвращаем ошибку 400 и сообщение о необходимости указать все необходимые аргументы
+class PartnerUpdateStatus(APIView):
+    """
+    Класс для отслеживания фонового импорта прайс-листа.
+
+    Methods:
+    - get: Retrieve the state and progress of the import task.
+
+    Attributes:
+    - None
+    """
+
+    def get(self, request, task_id, *args, **kwargs):
+        """
+        Получить состояние задачи импорта и статистику: сколько товаров прочитано,
+        записано и пропущено из-за ошибок, а также время выполнения.
+
+        Args:
+        - request (Request): The Django request object.
+        - task_id (str): id задачи, полученный от partner/update.
+
+        Returns:
+        - JsonResponse: The response containing the state and progress of the task.
+        """
+        if not request.user.is_authenticated:
+            return JsonResponse({'Status': False, 'Error': 'Log in required'}, status=403)
+
+        if request.user.type != 'shop':
+            return JsonResponse({'Status': False, 'Error': 'Только для магазинов'}, status=403)
+
+        result = get_result(task_id) # AsyncResult задачи из бекенда результатов Celery
+        if result.state == 'PENDING': # задача еще не начата воркером (или такой задачи нет)
+            return JsonResponse({'Status': True, 'Task': task_id, 'State': result.state})
+
+        if (result.kwargs or {}).get('user_id') != request.user.id: # задачи других магазинов не показываем
+            return JsonResponse({'Status': False, 'Error': 'Задача не найдена'}, status=404)
+
+        if result.failed():
+            return JsonResponse({'Status': False, 'Task': task_id, 'State': result.state, 'Error': str(result.result)})
+
+        return JsonResponse({'Status': True, 'Task': task_id, 'State': result.state, 'Progress': result.info})
+
+
+class PartnerExport(APIView):
+    """
+    Класс для выгрузки каталога магазина.
+
+    Methods:
+    - get: Stream the shop catalog as a file.
+
+    Attributes:
+    - None
+    """
+
+    def get(self, request, *args, **kwargs):
+        """
+        Выгрузить каталог магазина файлом. Формат задается параметром type:
+        yaml (по умолчанию, формат прайса для partner/update), csv или ndjson.
+
+        Args:
+        - request (Request): The Django request object.
+
+        Returns:
+        - StreamingHttpResponse: The catalog streamed in the requested format.
+        """
+        if not request.user.is_authenticated:
+            return JsonResponse({'Status': False, 'Error': 'Log in required'}, status=403)
+
+        if request.user.type != 'shop':
+            return JsonResponse({'Status': False, 'Error': 'Только для магазинов'}, status=403)
+
+        # параметр format занят DRF под выбор рендерера, поэтому формат выгрузки передается в type
+        export_format = request.query_params.get('type', 'yaml')
+        if export_format not in EXPORT_FORMATS:
+            return JsonResponse({'Status': False, 'Error': f'Неизвестный формат выгрузки: {export_format}'}, status=400)
+
+        shop = Shop.objects.filter(user_id=request.user.id).first()
+        if shop is None:
+            return JsonResponse({'Status': False, 'Error': 'Магазин не найден'}, status=404)
+
+        export, content_type, extension = EXPORT_FORMATS[export_format]
+        response = StreamingHttpResponse(export(shop), content_type=content_type) # каталог отдается по мере чтения из БД
+        response['Content-Disposition'] = f'attachment; filename="shop-{shop.id}.{extension}"'
+        return response
 
 
 class PartnerState(APIView):
@@ -616,6 +795,8 @@ class PartnerState(APIView):
             try:
                 # Обновляем статус магазина отфильтрованного по ID пользователя
                 Shop.objects.filter(user_id=request.user.id).update(state=strtobool(state)) # преобразует строку в логическое значение True или False 
+                for shop_id in Shop.objects.filter(user_id=request.user.id).values_list('id', flat=True):
+                    catalog_changed.send(sender=self.__class__, shop_id=shop_id) # товары магазина появились/пропали из каталога
                 return JsonResponse({'Status': True})
             except ValueError as error:
                 return JsonResponse({'Status': False, 'Errors': str(error)})
@@ -649,20 +830,23 @@ class PartnerOrders(APIView):
         if request.user.type != 'shop': # если пользователь не магазин
             return JsonResponse({'Status': False, 'Error': 'Только для магазинов'}, status=403)
 
+        try:
+            fields, expand = order_fieldsets(request)
+        except ValueError as error:
+            return JsonResponse({'Status': False, 'Errors': str(error)}, status=400)
+
         order = Order.objects.filter( # Фильтруем заказы по ID пользователя (владельца магазина),
-             # исключая заказы со статусом "в корзине"
-            ordered_items__product_info__shop__user_id=request.user.id).exclude(state='basket').prefetch_related(
-            # Загружаем информацию о заказе, включая количество заказанных товаров и их цену и добавляем контакты для доставки
-            'ordered_items__product_info__product__category', 
-            'ordered_items__product_info__product_parameters__parameter').select_related('contact').annotate(
-            # Вычисляем общую сумму заказа
-            total_sum=Sum(F('ordered_items__quantity') * F('ordered_items__product_info__price'))).distinct()
-        
+             # исключая заказы со статусом "в корзине"; подзапрос по позициям вместо JOIN - без повторов заказов
+            id__in=OrderItem.objects.filter(product_info__shop__user_id=request.user.id).values('order_id')
+        ).exclude(state='basket')
+        # Загружаем позиции заказа, товары и контакты для доставки - только то, что нужно для выбранных полей;
+        # total_sum - сумма позиций этого магазина, а не всего заказа
+        order = prepare_orders(order, fields, expand, shop_user_id=request.user.id)
+
         # ПОМЕТКА! prefetch_related - выполняет отдельные запросы для основной модели и для связанных объектов. Затем результаты объединяются в Python.
         # ПОМЕТКА! select_related - использует SQL JOIN для выполнения запроса и получения связанных объектов одновременно с основным объектом.
 
-        serializer = OrderSerializer(order, many=True)
-        return Response(serializer.data)
+        return Response(orders_data(order, fields, expand)) # вывод как у OrderSerializer(order, many=True)
 
 
     ######################## NEW NEW NEW ########################
@@ -884,6 +1068,7 @@ class OrderView(APIView):
     """
 
     # получить мои заказы
+    @method_decorator(condition(etag_func=order_etag)) # 304 по версии заказов пользователя без запросов к БД
     def get(self, request, *args, **kwargs):
         """
         Получить данные о заказах пользователя(покупателя).
@@ -896,20 +1081,20 @@ class OrderView(APIView):
         """
         if not request.user.is_authenticated: # 
             return JsonResponse({'Status': False, 'Error': 'Log in required'}, status=403)
+        try: # ?fields=id,state,total_sum&expand=product_info - только нужные поля и связанные данные
+            fields, expand = order_fieldsets(request)
+        except ValueError as error:
+            return JsonResponse({'Status': False, 'Errors': str(error)}, status=400)
         # фильтруем заказы по id пользователя(покупателя)
         # исключая из результата фильтрации заказы со статусом "в корзине"...
-        order = Order.objects.filter(
-            user_id=request.user.id).exclude(state='basket').prefetch_related( # добавляем связанную предварительную выборку:
-            'ordered_items__product_info__product__category', # заказанные_товары__информация_о_продукте__категория_продукта,
-                                    # заказанные_товары__информация_о_продукте__параметры_продукта_параметр
-            'ordered_items__product_info__product_parameters__parameter').select_related('contact').annotate( # выбираем связанные контакты и добавляем аннотацию 
-            total_sum=Sum(F('ordered_items__quantity') * F('ordered_items__product_info__price'))).distinct() # рассчитываем общую стоимость заказа, 
-                                                                                                # перемножая количество и цену товара и удаляем дубликаты из результата выборки
+        order = Order.objects.filter(user_id=request.user.id).exclude(state='basket')
+        # добавляем предварительную выборку позиций, товаров и параметров и контакты -
+        # только для выбранных полей (см. prepare_orders); общая стоимость заказа хранится в total_sum
+        order = prepare_orders(order, fields, expand)
         # ПОМЕТКА! prefetch_related - выполняет отдельные запросы для основной модели и для связанных объектов. Затем результаты объединяются в Python.
         # ПОМЕТКА! select_related - использует SQL JOIN для выполнения запроса и получения связанных объектов одновременно с основным объектом.
 
-        serializer = OrderSerializer(order, many=True)
-        return Response(serializer.data)
+        return Response(orders_data(order, fields, expand)) # вывод как у OrderSerializer(order, many=True)
 
     ######################### NEW NEW NEW ######################## 
     
@@ -932,21 +1117,24 @@ class OrderView(APIView):
         if {'id', 'contact'}.issubset(request.data): # проверка наличия в запросе id заказа и контактных данных покупателя
             if request.data['id'].isdigit():
                 try:
-                    # Получаем объект заказа
-                    order = Order.objects.get(
-                        user_id=request.user.id, # по id покупателя
-                        id=request.data['id'] # и по id заказа переданному в запросе
-                    )
-
-                    # ЗАМЕТКА!
-                    # если вы уверены в единственности объекта (например, для `id` или уникальных ключей, как здесь), 
-                    # использовать `.get()` не только быстрее, но и легче интерпретировать
-                    # https://docs.google.com/document/d/1_zO0NaMzGqY6ohgqYxi875pghBdFho9RvKxB5fhbjSc/edit?usp=sharing
-                    
-                    # Обновляем поля объекта заказа
-                    order.contact_id = request.data['contact']
-                    order.state = 'new' # устанавливаем статус заказа с "в корзине" на "новый"
-                    order.save() # сохраняем изменения в БД
+                    # корзина из кеша (если включена) записывается в БД и блокируется на время оформления
+                    with basket_store.checkout(request.user.id):
+                        # Получаем объект заказа
+                        order = Order.objects.get(
+                            user_id=request.user.id, # по id покупателя
+                            id=request.data['id'] # и по id заказа переданному в запросе
+                        )
+
+                        # ЗАМЕТКА!
+                        # если вы уверены в единственности объекта (например, для `id` или уникальных ключей, как здесь), 
+                        # использовать `.get()` не только быстрее, но и легче интерпретировать
+                        # https://docs.google.com/document/d/1_zO0NaMzGqY6ohgqYxi875pghBdFho9RvKxB5fhbjSc/edit?usp=sharing
+
+                        # переводим корзину в статус "новый" и списываем остатки позиций одной транзакцией
+                        # (см. backend/checkout.py); если какой-то позиции не хватает, заказ не оформляется
+                        failures = place_order(order, request.data['contact'])
+                    if failures:
+                        return JsonResponse({'Status': False, 'Errors': failures}, status=status.HTTP_409_CONFLICT)
 
                     # Отправляем сигнал с order (уведомление магазину от заказчика)
                     new_order.send(
@@ -961,6 +1149,11 @@ class OrderView(APIView):
                         {'Status': False, 'Errors': 'Заказ не найден'},
                         status=status.HTTP_404_NOT_FOUND
                     )
+                except BasketBusy as error:
+                    return JsonResponse(
+                        {'Status': False, 'Errors': str(error)},
+                        status=status.HTTP_409_CONFLICT
+                    )
                 except IntegrityError as error:
                     print(error)
                     return JsonResponse(
@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 
 import os
+import sys
 from dotenv import load_dotenv # pip install python-dotenv
 
 load_dotenv('.env')
@@ -62,6 +63,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'backend.middleware.CompressionMiddleware', # сжатие ответов gzip/brotli (см. backend/middleware.py), первым в списке
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -194,7 +196,7 @@ REST_FRAMEWORK = {
     'PAGE_SIZE': 40,
 
     'DEFAULT_RENDERER_CLASSES': (
-        'rest_framework.renderers.JSONRenderer',
+        'backend.renderers.UJSONRenderer', # JSONRenderer на ujson (см. backend/renderers.py)
         'rest_framework.renderers.BrowsableAPIRenderer',
     ), # Классы рендереров
 
@@ -205,6 +207,28 @@ REST_FRAMEWORK = {
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField' 
 
+# Ответы меньше этого размера (байт) не сжимаются (см. backend/middleware.py)
+COMPRESSION_MIN_SIZE = 1024
+
+# Кеш (ответы каталога и версии каталога и заказов, см. backend/cache.py) общий для всех процессов - в Redis:
+# версии увеличивает и импорт в воркере Celery, а ответы и ETag по ним отдает веб-процесс. По умолчанию -
+# база 1 Redis брокера (CACHE_REDIS_URL, в docker-compose 'redis://broker:6379/1'). Кеш в памяти процесса -
+# только в тестах (в остальных случаях manage.py check сообщает об ошибке, см. backend/checks.py)
+TESTING = 'pytest' in sys.modules or sys.argv[1:2] == ['test']
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    } if TESTING else {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.getenv('CACHE_REDIS_URL', 'redis://localhost:6379/1'),
+    }
+}
+
+# Хранение корзин: 'db' - сразу в Order/OrderItem, 'cache' - в кеше с отложенной записью в БД
+# (см. backend/basket_store.py; нужна задача flush_baskets по расписанию)
+BASKET_STORE = os.getenv('BASKET_STORE', 'db')
+BASKET_FLUSH_INTERVAL = 60 # период записи корзин из кеша в БД, секунд
+
 
 # Celery
 # Необходимо использовать имя контейнера Redis в качестве адреса для подключения, а не localhost. 
@@ -218,3 +242,10 @@ CELERY_TASK_SERIALIZER = 'json' # Сериализатор задач
 # В логе указано предупреждение о том, что настройка broker_connection_retry устареет в Celery 6.0. 
 # Чтобы отключить это, в конфиг добавляется:
 CELERY_BROKER_CONNECTION_RETRY_ON_STARTUP = True 
+CELERY_RESULT_EXTENDED = True # сохранять аргументы задачи вместе с результатом (по ним проверяется владелец импорта)
+CELERY_TASK_TRACK_STARTED = True # состояние STARTED вместо PENDING, когда воркер взял задачу
+CELERY_TASK_STORE_EAGER_RESULT = True # в eager-режиме (тесты) результаты задач тоже сохраняются в бекенд
+# Периодические задачи (воркер запускается с ключом -B или отдельный celery beat)
+CELERY_BEAT_SCHEDULE = {
+    'flush-baskets': {'task': 'backend.tasks.flush_baskets', 'schedule': BASKET_FLUSH_INTERVAL},
+} if BASKET_STORE == 'cache' else {}
@@ -0,0 +1,410 @@
+# Тесты движка импорта прайс-листов (backend/importer.py)
+
+import io
+import os
+import types
+
+import pytest
+import yaml
+from django.conf import settings
+from django.core.management import call_command, CommandError
+from django.db import IntegrityError
+from model_bakery import baker
+
+from backend.benchmark import measure_import, write_price_list
+from backend.cache import catalog_version
+from backend.catalog import rebuild_catalog
+from backend.feed import PriceListReader
+from backend.importer import PriceListImporter
+from backend.models import Shop, Category, Product, ProductInfo, Parameter, ProductParameter, Order, OrderItem, \
+    User, ProductFacet, CatalogEntry
+from backend.serializers import CatalogEntrySerializer, ProductInfoSerializer
+
+
+def make_goods(count: int, category_id: int = 1) -> list:
+    """
+    Формирует список товаров в формате прайс-листа (как в data/shop1.yaml).
+    """
+    return [{
+        'id': index,
+        'category': category_id,
+        'model': f'model/{index}',
+        'name': f'Товар {index}',
+        'price': 100 + index,
+        'price_rrc': 150 + index,
+        'quantity': 10,
+        'parameters': {'Цвет': 'черный', 'Встроенная память (Гб)': 256},
+    } for index in range(1, count + 1)]
+
+
+@pytest.mark.django_db
+class TestPriceListImporter:
+    """
+    Класс для тестирования пакетного импорта прайс-листа.
+    """
+    categories = [{'id': 1, 'name': 'Смартфоны'}]
+
+    def test_import_creates_catalog(self):
+        """
+        Проверяем, что импорт создает продукты, позиции магазина и их параметры.
+        """
+        shop = baker.make(Shop)
+        stats = PriceListImporter(shop).run(self.categories, make_goods(5))
+        assert stats.parsed == 5 and stats.created == 5
+        assert ProductInfo.objects.filter(shop=shop).count() == 5
+        assert ProductParameter.objects.filter(product_info__shop=shop).count() == 10
+        assert Parameter.objects.count() == 2 # имена параметров не дублируются
+        assert list(Category.objects.get(id=1).shops.all()) == [shop]
+        info = ProductInfo.objects.get(shop=shop, external_id=3)
+        assert info.product.name == 'Товар 3' and info.price == 103
+        assert info.product_parameters.get(parameter__name='Встроенная память (Гб)').value == '256'
+
+    def test_reimport_syncs_catalog(self):
+        """
+        Проверяем, что повторный импорт не плодит дубликатов продуктов и позиций
+        и удаляет позиции, которых больше нет в прайсе.
+        """
+        shop = baker.make(Shop)
+        PriceListImporter(shop).run(self.categories, make_goods(5))
+        stats = PriceListImporter(shop).run([{'id': 1, 'name': 'Телефоны'}], make_goods(3))
+        assert (stats.created, stats.updated, stats.deleted, stats.unchanged) == (0, 0, 2, 3)
+        assert ProductInfo.objects.filter(shop=shop).count() == 3
+        assert Product.objects.count() == 5
+        assert Category.objects.get(id=1).name == 'Телефоны' # категория переименована
+
+    def test_reimport_touches_only_changed_rows(self):
+        """
+        Проверяем, что синхронизация обновляет только изменившиеся позиции,
+        сохраняет id позиций и не затрагивает ссылающиеся на них позиции заказов.
+        """
+        shop = baker.make(Shop)
+        PriceListImporter(shop).run(self.categories, make_goods(4))
+        ids = dict(ProductInfo.objects.filter(shop=shop).values_list('external_id', 'id'))
+        order = baker.make(Order, user=baker.make(User), state='new')
+        order_item = baker.make(OrderItem, order=order, product_info_id=ids[1], quantity=1)
+
+        goods = make_goods(4)
+        goods[0]['price'] = 1 # изменилась цена
+        goods[1]['parameters'] = {'Цвет': 'белый'} # изменился один параметр, другой удален
+        goods.append(make_goods(5)[4]) # новая позиция
+        stats = PriceListImporter(shop).run(self.categories, goods)
+
+        assert (stats.created, stats.updated, stats.deleted, stats.unchanged) == (1, 2, 0, 2)
+        assert dict(ProductInfo.objects.filter(shop=shop, external_id__lte=4).values_list('external_id', 'id')) == ids
+        assert ProductInfo.objects.get(id=ids[1]).price == 1
+        assert list(ProductParameter.objects.filter(product_info_id=ids[2]).values_list('value', flat=True)) == ['белый']
+        assert OrderItem.objects.filter(id=order_item.id).exists()
+
+    def test_reimport_recalculates_basket_totals(self):
+        """
+        Проверяем, что удаление позиции, которой больше нет в прайсе, пересчитывает сумму корзин с ней.
+        """
+        shop = baker.make(Shop)
+        PriceListImporter(shop).run(self.categories, make_goods(2))
+        ids = dict(ProductInfo.objects.filter(shop=shop).values_list('external_id', 'id'))
+        basket = baker.make(Order, user=baker.make(User), state='basket', total_sum=301)
+        baker.make(OrderItem, order=basket, product_info_id=ids[1], quantity=1, price=101)
+        baker.make(OrderItem, order=basket, product_info_id=ids[2], quantity=2, price=100)
+
+        PriceListImporter(shop).run(self.categories, make_goods(2)[:1]) # позиции 2 больше нет в прайсе
+        basket.refresh_from_db()
+        assert basket.total_sum == 101
+
+    def test_reimport_keeps_ordered_offers(self):
+        """
+        Проверяем, что позиция оформленного заказа, которой больше нет в прайсе, не удаляется,
+        а снимается с продажи: строка заказа и его сумма сохраняются, из корзин позиция удаляется.
+        """
+        shop = baker.make(Shop)
+        PriceListImporter(shop).run(self.categories, make_goods(2))
+        ids = dict(ProductInfo.objects.filter(shop=shop).values_list('external_id', 'id'))
+        order = baker.make(Order, user=baker.make(User), state='delivered', total_sum=204)
+        order_item = baker.make(OrderItem, order=order, product_info_id=ids[2], quantity=2, price=102)
+        basket = baker.make(Order, user=baker.make(User), state='basket', total_sum=102)
+        baker.make(OrderItem, order=basket, product_info_id=ids[2], quantity=1, price=102)
+
+        stats = PriceListImporter(shop).run(self.categories, make_goods(1))
+        assert stats.deleted == 1
+        assert ProductInfo.objects.get(id=ids[2]).quantity == 0
+        assert CatalogEntry.objects.get(product_info_id=ids[2]).quantity == 0
+        assert OrderItem.objects.filter(id=order_item.id).exists()
+        assert Order.objects.get(id=order.id).total_sum == 204
+        assert not OrderItem.objects.filter(order=basket).exists()
+        assert Order.objects.get(id=basket.id).total_sum == 0
+        assert PriceListImporter(shop).run(self.categories, make_goods(1)).deleted == 0 # уже снята с продажи
+
+        order_item.delete() # заказов с позицией больше нет - следующий импорт ее удаляет
+        assert PriceListImporter(shop).run(self.categories, make_goods(1)).deleted == 1
+        assert not ProductInfo.objects.filter(id=ids[2]).exists()
+
+    def test_external_id_unique_per_shop(self):
+        """
+        Проверяем, что external_id уникален в пределах магазина.
+        """
+        shop, category = baker.make(Shop), baker.make(Category)
+        baker.make(ProductInfo, shop=shop, external_id=1, product=baker.make(Product, category=category))
+        with pytest.raises(IntegrityError): # другой продукт с тем же external_id
+            baker.make(ProductInfo, shop=shop, external_id=1, product=baker.make(Product, category=category))
+
+    def test_shared_rows_created_concurrently(self):
+        """
+        Проверяем, что продукт и имя параметра, созданные параллельным импортом после загрузки
+        справочников, не дублируются, а используются позициями этого импорта.
+        """
+        category = baker.make(Category, id=1, name='Смартфоны')
+        importer = PriceListImporter(baker.make(Shop))
+        importer._preload([1])
+        product = Product.objects.create(name='Товар 1', category=category) # создал другой импорт
+        parameter = Parameter.objects.create(name='Цвет')
+        importer.import_goods(make_goods(1))
+        assert Product.objects.filter(name='Товар 1').count() == 1
+        assert Parameter.objects.filter(name='Цвет').count() == 1
+        info = ProductInfo.objects.get(external_id=1)
+        assert info.product_id == product.id
+        assert info.product_parameters.filter(parameter=parameter).exists()
+
+    def test_invalid_goods_are_counted_as_failed(self):
+        """
+        Проверяем, что товары с ошибками пропускаются, а импорт остальных продолжается
+        и после каждого пакета сообщает о ходе выполнения.
+        """
+        shop = baker.make(Shop)
+        goods = make_goods(5)
+        goods[0]['price'] = 'дорого' # неверный тип цены
+        goods[1]['category'] = 999 # неизвестная категория
+        del goods[2]['parameters'] # нет обязательного поля
+        goods.append(dict(goods[4])) # повторный external_id
+        reports = []
+        stats = PriceListImporter(shop, batch_size=2, progress=lambda stats: reports.append(stats.parsed)).run(
+            self.categories, goods)
+        assert (stats.parsed, stats.written, stats.failed) == (6, 2, 4)
+        assert reports == [2, 4, 6, 6] # после каждого пакета и в конце импорта
+        assert ProductInfo.objects.filter(shop=shop).count() == 2
+
+    def test_import_maintains_catalog_entries(self):
+        """
+        Проверяем, что импорт поддерживает модель каталога для чтения: записи совпадают
+        с выводом ProductInfoSerializer, следуют за изменениями прайса и удаляются вместе с позициями.
+        """
+        shop = baker.make(Shop)
+        PriceListImporter(shop).run(self.categories, make_goods(3))
+        goods = make_goods(2)
+        goods[0]['price'] = 1
+        goods[1]['parameters'] = {'Цвет': 'белый'}
+        PriceListImporter(shop).run([{'id': 1, 'name': 'Телефоны'}], goods)
+
+        product_infos = ProductInfo.objects.filter(shop=shop).order_by('id')
+        entries = CatalogEntry.objects.filter(shop=shop).order_by('pk')
+        assert CatalogEntrySerializer(entries, many=True).data == ProductInfoSerializer(product_infos, many=True).data
+        assert entries[0].price == 1 and entries[0].shop_name == shop.name
+        assert entries[1].parameters == [{'parameter': 'Цвет', 'value': 'белый'}]
+        assert {entry.category_name for entry in entries} == {'Телефоны'} # категория переименована
+        assert CatalogEntry.objects.count() == 2 # запись удаленной позиции удалена каскадом
+
+        CatalogEntry.objects.all().delete()
+        assert rebuild_catalog() == 2 # перенос каталога, загруженного в обход импорта
+        assert CatalogEntrySerializer(CatalogEntry.objects.order_by('pk'), many=True).data == \
+            ProductInfoSerializer(product_infos, many=True).data
+
+    def test_rename_invalidates_other_shops(self, django_capture_on_commit_callbacks):
+        """
+        Проверяем, что переименование категории импортом одного магазина сбрасывает кеш каталога
+        других магазинов с товарами этой категории.
+        """
+        shop, other, unrelated = baker.make(Shop, _quantity=3)
+        PriceListImporter(shop).run(self.categories, make_goods(1))
+        PriceListImporter(other).run(self.categories, make_goods(1))
+        PriceListImporter(unrelated).run([{'id': 2, 'name': 'Ноутбуки'}], make_goods(1, category_id=2))
+        versions = {item.id: catalog_version(str(item.id)) for item in (other, unrelated)}
+        with django_capture_on_commit_callbacks(execute=True):
+            PriceListImporter(shop).run([{'id': 1, 'name': 'Телефоны'}], make_goods(1))
+        assert catalog_version(str(other.id)) > versions[other.id]
+        assert catalog_version(str(unrelated.id)) == versions[unrelated.id]
+
+    def test_import_rebuilds_facets(self):
+        """
+        Проверяем, что импорт пересчитывает счетчики фасетов магазина.
+        """
+        shop = baker.make(Shop)
+        goods = make_goods(4)
+        goods[0]['parameters'] = {'Цвет': 'белый'}
+        PriceListImporter(shop).run(self.categories, goods)
+        facets = {(facet.parameter.name, facet.value): facet.count for facet in ProductFacet.objects.filter(shop=shop)}
+        assert facets == {('Цвет', 'белый'): 1, ('Цвет', 'черный'): 3, ('Встроенная память (Гб)', '256'): 3}
+
+        PriceListImporter(shop).run(self.categories, make_goods(2))
+        assert dict(ProductFacet.objects.filter(shop=shop).values_list('value', 'count')) == {'черный': 2, '256': 2}
+
+    def test_dry_run_builds_plan_without_writes(self, django_assert_max_num_queries):
+        """
+        Проверяем, что dry_run составляет план изменений и ничего не записывает.
+        """
+        shop = baker.make(Shop)
+        PriceListImporter(shop).run(self.categories, make_goods(5))
+        goods = make_goods(6)
+        goods[0]['price'] = 1 # изменилась цена
+        goods[1]['quantity'] = 0 # изменился остаток
+        goods[2]['parameters'] = {'Цвет': 'белый'} # изменились параметры
+        del goods[4] # позиция удалена из прайса, позиция 6 - новая
+        goods.append({**make_goods(7, category_id=2)[6], 'name': 'Новый продукт'}) # новая категория и продукт
+        catalog = list(ProductInfo.objects.values_list('id', 'price', 'quantity'))
+
+        with django_assert_max_num_queries(8): # только чтение каталога в словари
+            importer = PriceListImporter(shop, dry_run=True)
+            stats = importer.run(self.categories + [{'id': 2, 'name': 'Планшеты'}], goods)
+
+        assert stats.dry_run and (stats.created, stats.updated, stats.deleted, stats.unchanged) == (2, 3, 1, 1)
+        assert (stats.price_changed, stats.quantity_changed) == (1, 1)
+        assert importer.plan.as_dict() == {
+            'created': [6, 7],
+            'price_changed': [{'id': 1, 'price': [101, 1], 'price_rrc': [151, 151]}],
+            'quantity_changed': [{'id': 2, 'quantity': [10, 0]}],
+            'deleted': [5],
+        }
+        assert list(ProductInfo.objects.values_list('id', 'price', 'quantity')) == catalog
+        assert not Category.objects.filter(id=2).exists() and not Product.objects.filter(name='Новый продукт').exists()
+
+        # для нового (несохраненного) магазина все позиции прайса - новые
+        stats = PriceListImporter(Shop(name='Новый магазин'), dry_run=True).run(self.categories, make_goods(3))
+        assert (stats.created, stats.deleted) == (3, 0) and not Shop.objects.filter(name='Новый магазин').exists()
+
+    def test_query_count_does_not_depend_on_goods(self, django_assert_max_num_queries):
+        """
+        Проверяем, что число запросов к БД определяется числом пакетов, а не числом товаров.
+        """
+        shop = baker.make(Shop)
+        # построчная запись потребовала бы ~5000 запросов; SQLite ограничивает число параметров запроса,
+        # поэтому пакеты bulk_create дробятся (больше всего - записи каталога для чтения)
+        with django_assert_max_num_queries(60):
+            PriceListImporter(shop, batch_size=500).run(self.categories, make_goods(1000))
+        assert ProductInfo.objects.filter(shop=shop).count() == 1000
+
+
+class TestPriceListReader:
+    """
+    Класс для тестирования потокового разбора прайс-листа.
+    """
+    def test_reader_matches_full_load(self):
+        """
+        Проверяем, что потоковый разбор data/shop1.yaml совпадает с загрузкой документа целиком.
+        """
+        path = os.path.join(settings.BASE_DIR, '..', '..', 'data', 'shop1.yaml')
+        with open(path, 'rb') as file:
+            content = file.read()
+        expected = yaml.safe_load(content)
+        reader = PriceListReader(io.BytesIO(content))
+        assert reader.shop == expected['shop']
+        assert reader.categories == expected['categories']
+        assert list(reader.goods()) == expected['goods']
+
+    def test_goods_are_read_lazily(self):
+        """
+        Проверяем, что товары читаются по одному: ошибка в конце прайса
+        не мешает получить товары, идущие до нее.
+        """
+        content = yaml.safe_dump({'shop': 'Магазин', 'categories': [], 'goods': make_goods(2)},
+                                 allow_unicode=True, sort_keys=False)
+        goods = PriceListReader(io.StringIO(content + '- [broken')).goods()
+        assert next(goods)['id'] == 1
+        assert next(goods)['id'] == 2
+        with pytest.raises(yaml.YAMLError):
+            next(goods)
+
+    def test_goods_before_header(self):
+        """
+        Проверяем, что прайс, в котором goods идет раньше shop и categories, тоже читается.
+        """
+        content = yaml.safe_dump({'shop': 'Магазин', 'categories': [{'id': 1, 'name': 'Смартфоны'}],
+                                  'goods': make_goods(3)}, allow_unicode=True) # ключи отсортированы по алфавиту
+        reader = PriceListReader(io.StringIO(content))
+        assert reader.shop == 'Магазин' and reader.categories == [{'id': 1, 'name': 'Смартфоны'}]
+        assert [item['id'] for item in reader.goods()] == [1, 2, 3]
+
+    def test_missing_shop(self):
+        """
+        Проверяем, что прайс без раздела shop отклоняется.
+        """
+        with pytest.raises(ValueError):
+            PriceListReader(io.StringIO('goods: []'))
+
+
+@pytest.mark.django_db
+class TestImportFeedsCommand:
+    """
+    Класс для тестирования команды параллельного импорта manage.py import_feeds.
+    """
+    def test_import_feeds(self, tmp_path, mocker):
+        """
+        Проверяем, что команда импортирует несколько прайсов и ошибка в одном из них
+        не мешает импорту остальных.
+        """
+        shop1 = os.path.join(settings.BASE_DIR, '..', '..', 'data', 'shop1.yaml')
+        shop2 = tmp_path / 'shop2.yaml'
+        shop2.write_text(yaml.safe_dump({'shop': 'Магазин 2', 'categories': [{'id': 1, 'name': 'Смартфоны'}],
+                                         'goods': make_goods(3)}, allow_unicode=True), encoding='utf-8')
+        broken = tmp_path / 'broken.yaml'
+        broken.write_text('goods: []', encoding='utf-8')
+        stdout = io.StringIO()
+
+        with pytest.raises(CommandError):
+            call_command('import_feeds', shop1, str(shop2), str(broken), workers=2, stdout=stdout,
+                         stderr=io.StringIO())
+
+        with open(shop1, encoding='utf-8') as file:
+            expected = yaml.safe_load(file)
+        assert ProductInfo.objects.filter(shop__name=expected['shop']).count() == len(expected['goods'])
+        assert ProductInfo.objects.filter(shop__name='Магазин 2').count() == 3
+        assert 'Магазин 2: прочитано 3, создано 3' in stdout.getvalue()
+
+        run = mocker.spy(PriceListImporter, 'run')
+        call_command('import_feeds', str(shop2), stdout=io.StringIO())
+        goods = run.call_args.args[2]
+        assert isinstance(goods, types.GeneratorType) # товары читаются из файла потоком, а не списком
+
+
+class TestSyntheticPriceList:
+    """
+    Класс для тестирования генератора синтетических прайс-листов и замера импорта.
+    """
+    def test_generated_price_list_is_readable(self):
+        """
+        Проверяем, что сгенерированный прайс читается, воспроизводим по seed
+        и содержит заданное число товаров, категорий и параметров.
+        """
+        stream = io.StringIO()
+        write_price_list(stream, goods=200, categories=5, parameters=3, seed=1)
+        again = io.StringIO()
+        write_price_list(again, goods=200, categories=5, parameters=3, seed=1)
+        assert stream.getvalue() == again.getvalue()
+
+        document = yaml.safe_load(stream.getvalue())
+        assert len(document['categories']) == 5 and len(document['goods']) == 200
+        assert all(len(item['parameters']) == 3 for item in document['goods'])
+        assert [item['id'] for item in document['goods']] == list(range(1, 201))
+
+    def test_skew(self):
+        """
+        Проверяем, что при перекосе товары концентрируются в первых категориях,
+        а без перекоса распределены примерно равномерно.
+        """
+        def first_category_share(skew):
+            stream = io.StringIO()
+            write_price_list(stream, goods=1000, categories=10, parameters=0, skew=skew)
+            goods = yaml.safe_load(stream.getvalue())['goods']
+            return sum(item['category'] == 1 for item in goods) / len(goods)
+
+        assert first_category_share(0) < 0.2
+        assert first_category_share(2) > 0.5
+
+    @pytest.mark.django_db
+    def test_measure_import(self, tmp_path):
+        """
+        Проверяем, что замер импортирует прайс и считает запросы к БД.
+        """
+        path = tmp_path / 'feed.yaml'
+        with open(path, 'w', encoding='utf-8') as file:
+            write_price_list(file, goods=50)
+        result = measure_import(str(path))
+        assert result['created'] == 50 and result['failed'] == 0
+        assert 0 < result['queries'] < 50
+        assert measure_import(str(path))['unchanged'] == 50
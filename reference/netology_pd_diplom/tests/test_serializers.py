@@ -0,0 +1,96 @@
+# Контрактные тесты быстрой сериализации (backend/fast_serializers.py, backend/renderers.py):
+# вывод должен совпадать с выводом сериализаторов и JSONRenderer DRF байт в байт.
+
+import os # для пути к data/shop1.yaml
+import pytest # для написания тестов
+from datetime import datetime, timezone # для проверки кодирования дат
+from django.conf import settings # для пути к data/shop1.yaml
+from django.contrib.auth import get_user_model # для получения модели пользователя
+from django.utils.translation import gettext_lazy as _ # ленивые строки в сообщениях об ошибках
+from model_bakery import baker # для создания тестовых данных
+from rest_framework.renderers import JSONRenderer # для сравнения отрисованного ответа
+from backend.fast_serializers import CATALOG_ENTRY_VALUES, catalog_entries_data, catalog_entry_data, \
+    catalog_entry_values, orders_data, prepare_orders
+from backend.feed import PriceListReader
+from backend.importer import PriceListImporter
+from backend.renderers import UJSONRenderer
+from backend.models import Shop, CatalogEntry, Order, OrderItem, Contact
+from backend.serializers import CatalogEntrySerializer, OrderSerializer
+
+User = get_user_model() # получаем модель пользователя
+
+
+def render(data) -> bytes:
+    return JSONRenderer().render(data)
+
+
+@pytest.fixture
+def shop1():
+    """
+    Фикстура магазина с каталогом из data/shop1.yaml (позиции с параметрами).
+    """
+    path = os.path.join(settings.BASE_DIR, '..', '..', 'data', 'shop1.yaml')
+    with open(path, 'rb') as file:
+        reader = PriceListReader(file)
+        shop = baker.make(Shop, name=reader.shop)
+        PriceListImporter(shop).run(reader.categories, reader.goods())
+    return shop
+
+
+@pytest.mark.django_db
+class TestFastSerializers:
+    """
+    Класс для проверки совпадения быстрой сериализации с сериализаторами DRF.
+    """
+    def test_catalog_entries(self, shop1):
+        entries = CatalogEntry.objects.order_by('pk')
+        assert entries.exists()
+        fast = [catalog_entry_data(row) for row in entries.values(*CATALOG_ENTRY_VALUES)]
+        assert render(fast) == render(CatalogEntrySerializer(entries, many=True).data)
+
+    def test_orders(self, shop1):
+        user = baker.make(User)
+        contact = baker.make(Contact, user=user, house='1', apartment='') # часть полей адреса пустая
+        infos = list(shop1.product_infos.order_by('id')[:3])
+        basket = baker.make(Order, user=user, state='basket') # без контакта
+        confirmed = baker.make(Order, user=user, state='confirmed', contact=contact)
+        baker.make(Order, user=user, state='new') # без позиций: total_sum = 0
+        for quantity, product_info in enumerate(infos, start=1):
+            OrderItem.objects.create(order=basket, product_info=product_info, quantity=quantity)
+        OrderItem.objects.create(order=confirmed, product_info=infos[0], quantity=5)
+
+        orders = prepare_orders(Order.objects.filter(user_id=user.id)) # тот же запрос, что в OrderView.get
+        fast = orders_data(orders)
+        assert len(fast) == 3
+        assert render(fast) == render(OrderSerializer(orders, many=True).data)
+
+        # выбранные поля совпадают с соответствующими полями полного вывода
+        fields = frozenset({'id', 'total_sum', 'contact'})
+        assert orders_data(prepare_orders(Order.objects.filter(user_id=user.id), fields), fields) == [
+            {field: order[field] for field in ('id', 'total_sum', 'contact')} for order in fast]
+
+    def test_catalog_entry_fields(self, shop1):
+        entries = CatalogEntry.objects.order_by('pk')
+        full = [catalog_entry_data(row) for row in entries.values(*CATALOG_ENTRY_VALUES)]
+        fields = frozenset({'id', 'product', 'price'})
+        assert catalog_entries_data(entries.values(*catalog_entry_values(fields)), fields) == [
+            {'id': item['id'], 'product': item['product'], 'price': item['price']} for item in full]
+
+
+@pytest.mark.parametrize('media_type', ['application/json', 'application/json; indent=4',
+                                        'application/json; indent=2'])
+def test_ujson_renderer(media_type):
+    """
+    Проверяем, что UJSONRenderer отрисовывает данные так же, как JSONRenderer.
+    """
+    data = {
+        'Status': False,
+        'Error': _('Пользователь не найден'),
+        'url': 'https://example.com/shop1.yaml',
+        'dt': datetime(2025, 1, 31, 12, 0, tzinfo=timezone.utc),
+        'results': [{'id': 1, 'price': 110000, 'rate': 0.5, 'name': 'Смартфон\u2028Apple', 'tags': [], 'shop': None,
+                     'parameters': {}, 'offers': [[], {}]}],
+        'meta': {'sizes': [[1, 2], [3]], 'empty': {'nested': {}}},
+    }
+    assert UJSONRenderer().render(data, media_type) == JSONRenderer().render(data, media_type)
+    assert UJSONRenderer().render(None) == b''